@@ -0,0 +1,87 @@
+"""Compares the blocked domains regex with the suffix lookup of DomainSet.
+
+Blocklists of increasing size are generated into a temporary file, then
+loaded and searched with messages containing a few unblocked URLs, then
+with long messages that make a host regex backtrack. Run
+from the repository root: ``python -m benchmarks.censor_domains``
+"""
+import os
+import random
+import re
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+from utils.domains import DomainSet
+
+SIZES = 1000, 10000, 100000, 1000000
+REGEX_LIMIT = 100000  # Larger alternations take too long to compile
+MESSAGES = 1000
+TLDS = "com", "net", "org", "io", "gg", "co.uk", "xyz"
+# Messages that made an unanchored host regex backtrack at every position
+ADVERSARIAL = {
+    '"x." * 2000': "x." * 2000,
+    '"a" * 4000 + "."': "a" * 4000 + ".",
+    '"a@" * 2000 + "."': "a@" * 2000 + ".",
+    'long labels': ("a" * 62 + ".") * 64,
+}
+
+
+def domain(rng: random.Random) -> str:
+    name = "".join(rng.choices("abcdefghijklmnopqrstuvwxyz0123456789-", k=rng.randint(4, 16))).strip("-") or "x"
+    return f"{name}.{rng.choice(TLDS)}"
+
+
+def messages() -> list:
+    rng = random.Random(0)
+    return [
+        f"look at https://www.{domain(rng)}/some/page and {domain(rng)} or http://cdn.{domain(rng)}:8080/x.png ok"
+        for _ in range(MESSAGES)
+    ]
+
+
+def timed(search, texts: list) -> float:
+    start = perf_counter()
+    for text in texts:
+        assert search(text) is None
+    return (perf_counter() - start) / len(texts)
+
+
+def main():
+    texts = messages()
+    path = os.path.join(tempfile.mkdtemp(), "blocked_domains.txt")
+    print(f"{'domains':>8} {'load':>8} {'memory':>9} {'suffixes':>10} {'regex load':>11} {'regex':>10}")
+    for size in SIZES:
+        rng = random.Random(size)
+        with open(path, "w") as f:
+            for _ in range(size):
+                f.write(f"blocked-{domain(rng)}\n")
+
+        tracemalloc.start()
+        start = perf_counter()
+        blocked = DomainSet.load(path)
+        load = perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        new = timed(blocked.search, texts)
+
+        old = ""
+        if size <= REGEX_LIMIT:
+            start = perf_counter()
+            with open(path) as f:
+                regex = re.compile(
+                    f"(https?://)?(www\\.)?({'|'.join(map(re.escape, f.read().strip().splitlines()))})",
+                    re.IGNORECASE,
+                )
+            build = perf_counter() - start
+            old = f"{build:>10.2f}s {timed(regex.search, texts) * 1e6:>8.1f}us"
+        print(f"{size:>8} {load:>7.2f}s {memory / 2 ** 20:>7.1f}MB {new * 1e6:>8.1f}us {old}")
+    os.remove(path)
+
+    print()
+    for name, text in ADVERSARIAL.items():
+        print(f"{name:<20} {len(text):>5} chars {timed(blocked.search, [text] * 10) * 1e3:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Compares calling the profanity model per message with micro-batching it.
+
+Messages arrive at a fixed rate; the direct path calls ``predict([content])``
+on the event loop like the censor used to, the batched path goes through
+:class:`utils.inference.BatchPredictor`. Latency is from a message's arrival
+to its verdict. Run from the repository root: ``python -m benchmarks.censor_ml``
+"""
+import asyncio
+import random
+from time import perf_counter
+
+from profanity_check import predict
+
+from utils.inference import BatchPredictor
+
+RATES = 10, 100, 500, 1000, 2000
+SECONDS = 2
+WORDS = "the quick brown fox jumps over lazy dog crafting table 2b2t planks wood server base".split()
+
+
+def corpus(count: int) -> list:
+    rng = random.Random(count)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(3, 30))) for _ in range(count)]
+
+
+async def run(check, rate: int) -> tuple:
+    """Feeds ``rate`` messages a second to ``check``, returns (throughput, p50, p99)."""
+    messages = corpus(rate * SECONDS)
+    latencies = []
+
+    async def handle(message: str, arrival: float):
+        await check(message)
+        latencies.append(perf_counter() - arrival)
+
+    tasks = []
+    start = perf_counter()
+    for i, message in enumerate(messages):
+        arrival = start + i / rate
+        delay = arrival - perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(handle(message, arrival)))
+    await asyncio.gather(*tasks)
+    elapsed = perf_counter() - start
+    latencies.sort()
+    return (
+        len(messages) / elapsed,
+        latencies[len(latencies) // 2],
+        latencies[int(len(latencies) * 0.99)],
+    )
+
+
+async def direct(message: str):
+    return predict([message])[0]
+
+
+async def main():
+    predictor = BatchPredictor(predict)
+    await asyncio.gather(*(predictor(message) for message in corpus(32)))  # Load the model in the worker
+    predict(["warm up"])
+
+    print(f"{'rate':>6} {'':>8} {'msgs/s':>8} {'p50':>9} {'p99':>9}")
+    for rate in RATES:
+        for name, check in ("direct", direct), ("batched", predictor):
+            throughput, p50, p99 = await run(check, rate)
+            print(f"{rate:>6} {name:>8} {throughput:>8.0f} {p50 * 1e3:>7.1f}ms {p99 * 1e3:>7.1f}ms")
+    predictor.close()
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
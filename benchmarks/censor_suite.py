@@ -0,0 +1,148 @@
+"""Runs synthetic message corpora through every rule of the Censor cog.
+
+The cog is built from the real files in ``config/`` with every rule turned
+on (the ML model only with ``--ml``) and the verdict cache off, so each
+message goes through the rule chain. Prints messages per second and the
+latency of each rule per corpus, and saves them as JSON to compare commits.
+Run from the repository root: ``python -m benchmarks.censor_suite``
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+from time import perf_counter
+
+from cogs.censor import Censor, DOMAINS_FILE, WORDS_FILE
+from utils.rule_stats import RuleStats, format_ns
+
+WORDS = (
+    "the quick brown fox jumps over lazy dog crafting table 2b2t planks wood server base "
+    "highway nether portal elytra render distance coordinates lag machine queue priority"
+).split()
+UNICODE_NOISE = "ｔｈｅ", "qυісk", "ｂｒｏｗｎ", "f​o‍x", "日本語", "🙂", "𝐬𝐞𝐫𝐯𝐞𝐫", "crème", "Ⓦⓞⓞⓓ", "ℌello"
+TLDS = "com", "net", "org", "io", "gg"
+
+
+class Bot:
+    """Just enough of CTBot for the censor cog."""
+
+    def __init__(self):
+        self.loop = asyncio.get_event_loop()
+
+    async def log(self, *args):
+        pass
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(WORDS, k=words))
+
+
+def url(rng: random.Random, domains: list) -> str:
+    if domains and rng.random() < 0.2:
+        host = rng.choice(domains)
+    else:
+        host = f"{''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(4, 12)))}.{rng.choice(TLDS)}"
+    return rng.choice(("", "http://", "https://", "https://www.")) + host + rng.choice(("", "/", "/watch?v=abc"))
+
+
+def corpora(count: int) -> dict:
+    rng = random.Random(0)
+    with open(WORDS_FILE) as f:
+        blocked = [word for word in f.read().split("\n") if word.strip()]
+    with open(DOMAINS_FILE) as f:
+        domains = [domain.strip() for domain in f if domain.strip()]
+    return {
+        "clean": [sentence(rng, rng.randint(3, 30)) for _ in range(count)],
+        "dirty": [
+            f"{sentence(rng, rng.randint(0, 15))} {rng.choice(blocked)} {sentence(rng, rng.randint(0, 15))}"
+            for _ in range(count)
+        ],
+        "long": [sentence(rng, 300)[:1900] for _ in range(count)],
+        "unicode": [
+            " ".join(rng.choice(WORDS) if rng.random() < 0.5 else rng.choice(UNICODE_NOISE) for _ in range(20))
+            for _ in range(count)
+        ],
+        "url": [
+            " ".join(url(rng, domains) if rng.random() < 0.3 else rng.choice(WORDS) for _ in range(12))
+            for _ in range(count)
+        ],
+    }
+
+
+async def run(cog: Censor, messages: list) -> dict:
+    for name in cog.stats:
+        cog.stats[name] = RuleStats()
+    hits = 0
+    start = perf_counter()
+    for message in messages:
+        hits += await cog.verdict(message) is not None
+    elapsed = perf_counter() - start
+    return {
+        "messages_per_second": len(messages) / elapsed,
+        "censored": hits / len(messages),
+        "rules": {
+            name: {
+                "runs": stats.evaluations,
+                "hits": stats.hits,
+                "mean_ns": stats.mean_ns(),
+                "p50_ns": stats.percentile_ns(50),
+                "p90_ns": stats.percentile_ns(90),
+                "p99_ns": stats.percentile_ns(99),
+            }
+            for name, stats in cog.stats.items()
+            if stats.evaluations
+        },
+    }
+
+
+def commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--messages", type=int, default=5000, help="messages per corpus")
+    parser.add_argument("--ml", action="store_true", help="also run the profanity model")
+    parser.add_argument("--output", help="where to save the results, censor_suite-<commit>.json by default")
+    args = parser.parse_args()
+    output = args.output or f"censor_suite-{commit()}.json"
+
+    cog = Censor(Bot())
+    cog.swap_lists(
+        {
+            **cog.config,
+            "message_char_limit": cog.config["message_char_limit"] or 2000,
+            "caps_limit_enabled": True,
+            "filter_domains": True,
+            "profanity_filter": True,
+            "profanity_filter_ml": args.ml,
+            "verdict_cache_size": 0,
+        },
+        cog.blocked_words_matcher,
+        cog.blocked_nicks_matcher,
+        cog.blocked_domains,
+    )
+
+    results = {"commit": commit(), "messages": args.messages, "ml": args.ml, "corpora": {}}
+    for corpus, messages in corpora(args.messages).items():
+        result = results["corpora"][corpus] = await run(cog, messages)
+        print(f"{corpus}: {result['messages_per_second']:.0f} msgs/s, {result['censored'] * 100:.0f}% censored")
+        for name, rule in result["rules"].items():
+            print(
+                f"  {name:<20} {rule['runs']:>6} runs {rule['hits']:>6} hits  mean {format_ns(rule['mean_ns']):>8}"
+                f"  p50 {format_ns(rule['p50_ns']):>8}  p90 {format_ns(rule['p90_ns']):>8}"
+                f"  p99 {format_ns(rule['p99_ns']):>8}"
+            )
+    cog.cog_unload()
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Saved to {output}")
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,56 @@
+"""Compares the blocked words regex with the Aho-Corasick matcher.
+
+Messages are clean, so both have to scan the whole text. Run from the
+repository root: ``python -m benchmarks.censor_words``
+"""
+import random
+import re
+from time import perf_counter
+
+from utils.aho_corasick import AhoCorasick
+
+LENGTHS = 10, 100, 500, 1000, 2000, 4000
+MESSAGES = 200
+WORDS = "the quick brown fox jumps over lazy dog crafting table 2b2t planks wood server base".split()
+
+
+def corpus(length: int) -> list:
+    rng = random.Random(length)
+    messages = []
+    for _ in range(MESSAGES):
+        text = ""
+        while len(text) < length:
+            text += rng.choice(WORDS) + rng.choice("  ,.!?")
+        messages.append(text[:length])
+    return messages
+
+
+def timed(search, messages: list) -> float:
+    start = perf_counter()
+    for message in messages:
+        search(message)
+    return (perf_counter() - start) / len(messages)
+
+
+def main():
+    with open("config/blocked_words.txt") as f:
+        bw = f.read()
+    start = perf_counter()
+    regex = re.compile("|".join(map(re.escape, bw.strip().split("\n"))), flags=re.IGNORECASE)
+    regex_build = perf_counter() - start
+    start = perf_counter()
+    matcher = AhoCorasick(bw.split("\n"))
+    matcher_build = perf_counter() - start
+    print(f"build: regex {regex_build * 1e3:.1f}ms, aho-corasick {matcher_build * 1e3:.1f}ms")
+
+    print(f"{'length':>7} {'regex':>12} {'aho-corasick':>14} {'speedup':>8}")
+    for length in LENGTHS:
+        messages = corpus(length)
+        assert all(regex.search(m) is None and matcher.search(m) is None for m in messages)
+        old = timed(regex.search, messages)
+        new = timed(matcher.search, messages)
+        print(f"{length:>7} {old * 1e6:>10.1f}us {new * 1e6:>12.1f}us {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
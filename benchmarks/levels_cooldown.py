@@ -0,0 +1,115 @@
+"""Measures the per-message overhead of Levels.on_message.
+
+"before" is the handler as it was before the cooldown index: every message
+awaits the guild's data and its lock before the cooldown is checked. "after"
+is the current handler, including its share of applying the buffered grants
+every BATCH_INTERVAL seconds. Run from the repository root:
+``python -m benchmarks.levels_cooldown``
+"""
+import asyncio
+import collections
+import datetime
+import random
+import types
+from time import perf_counter
+
+from cogs.levels import BATCH_INTERVAL, COOLDOWN, Levels
+from utils.level_store import LevelStore
+
+MEMBERS = 2_000
+MESSAGES = 200_000
+RATE = 50  # Messages per second in the simulated guild
+
+
+class Bot:
+    """Just enough of CTBot for the levels cog."""
+
+    def __init__(self):
+        self.loop = asyncio.get_event_loop()
+        self.config = {"xp_curve": {"base": 200, "factor": 1.32, "offset": -100}}
+        self.levels = LevelStore(self.read)
+
+    @staticmethod
+    async def read(name, convert):
+        return convert({})
+
+    def record(self, name, *path):
+        pass
+
+    async def log(self, *args):
+        pass
+
+
+class Channel:
+    async def send(self, content):
+        pass
+
+
+def messages():
+    rng = random.Random(0)
+    guild = types.SimpleNamespace(id=614889263183560840)
+    channel = Channel()
+    authors = [
+        types.SimpleNamespace(id=10 ** 17 + i, bot=False, mention=f"<@{10 ** 17 + i}>") for i in range(MEMBERS)
+    ]
+    start = datetime.datetime(2020, 1, 1)
+    return [
+        types.SimpleNamespace(
+            author=rng.choice(authors),
+            guild=guild,
+            channel=channel,
+            created_at=start + datetime.timedelta(seconds=i / RATE),
+        )
+        for i in range(MESSAGES)
+    ]
+
+
+global_lock = None
+guild_locks = collections.defaultdict(asyncio.Lock)
+
+
+async def before(cog: Levels, message):
+    global global_lock
+    if global_lock is None:
+        global_lock = asyncio.Lock()
+
+    members = await cog.bot.levels.fetch(str(message.guild.id))
+    async with global_lock:
+        pass
+    async with guild_locks[str(message.guild.id)]:
+        row = members.row(message.author.id)
+        now = message.created_at.timestamp()
+        if now - members.timestamp[row] > COOLDOWN:
+            if random.randrange(5) == 0:
+                members.timestamp[row] = now
+                members.add_xp(row, random.randrange(10, 16))
+                level = cog.curve.level(members.xp[row])
+                if level > members.level[row]:
+                    members.level[row] = level
+
+
+async def after(cog: Levels, message):
+    await cog.on_message(message)
+    if message.created_at.timestamp() % BATCH_INTERVAL < 1 / RATE:
+        await cog.apply_pending()
+
+
+async def run(handler, batch) -> float:
+    cog = Levels(Bot())
+    start = perf_counter()
+    for message in batch:
+        await handler(cog, message)
+    elapsed = perf_counter() - start
+    cog.cog_unload()
+    return elapsed / len(batch)
+
+
+def main():
+    batch = messages()
+    loop = asyncio.get_event_loop()
+    for name, handler in ("before", before), ("after", after):
+        print(f"{name:>6}: {loop.run_until_complete(run(handler, batch)) * 1e6:.2f}us per message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Compares the memory used by the old dict-per-member level data with GuildLevels.
+
+Run from the repository root: ``python -m benchmarks.levels_memory``
+"""
+import gc
+import random
+import tracemalloc
+
+from utils.level_store import GuildLevels
+
+SIZES = 100_000, 1_000_000
+
+
+def members(n: int):
+    """Yields ``n`` members with realistic snowflake ids and values."""
+    rng = random.Random(n)
+    for _ in range(n):
+        yield rng.randrange(10 ** 17, 10 ** 18), {
+            "timestamp": 1.6e9 + rng.random() * 1e8,
+            "xp": rng.randrange(20_000),
+            "level": rng.randrange(30),
+        }
+
+
+def measure(build, n: int) -> int:
+    gc.collect()
+    tracemalloc.start()
+    data = build(n)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del data
+    return size
+
+
+def build_dicts(n: int) -> dict:
+    return {str(user_id): member for user_id, member in members(n)}
+
+
+def build_arrays(n: int) -> GuildLevels:
+    guild = GuildLevels()
+    for user_id, member in members(n):
+        guild[user_id] = member
+    return guild
+
+
+def main():
+    print(f"{'members':>10} {'dicts':>12} {'arrays':>12} {'per member':>20} {'ratio':>6}")
+    for n in SIZES:
+        dicts = measure(build_dicts, n)
+        arrays = measure(build_arrays, n)
+        print(
+            f"{n:>10,} {dicts / 2 ** 20:>10.1f}MB {arrays / 2 ** 20:>10.1f}MB "
+            f"{dicts / n:>8.0f}B -> {arrays / n:>5.0f}B {dicts / arrays:>6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,16 @@
+import asyncio
+import copy
 import json
 import traceback
-from pathlib import Path
-import os
+from concurrent.futures import ThreadPoolExecutor
 
 import discord
 from discord.ext import commands
 
 from utils import utils
+from utils.journal import Journal
+from utils.level_store import LevelStore
+from utils.sqlite_store import SQLiteStore
 
 
 class CTBot(commands.Bot):
@@ -15,11 +19,16 @@ class CTBot(commands.Bot):
             self.log_func = log_func
         self.config = {}
 
-        Path("data").mkdir(exist_ok=True)
+        self.store = None
+        self._executor = ThreadPoolExecutor(1, "storage")  # One thread keeps writes in order
+        self._dirty = {}  # Paths changed since the last flush, per namespace
+        self._dirty_count = 0
+        self._flush_event = asyncio.Event()
 
         self._data = {}
-        for name in "appeal_ban", "coin", "core_commands", "levels":
+        for name in "appeal_ban", "coin", "core_commands", "search_checkpoints":
             self._data[name] = {}
+        self.levels = LevelStore(self.read)
 
         self.load()
 
@@ -31,6 +40,8 @@ class CTBot(commands.Bot):
 
         self.remove_command("help")
 
+        self.loop.create_task(self.flush_task())
+
     def __getattr__(self, item):
         if item in self._data:
             return self._data[item]
@@ -38,33 +49,143 @@ class CTBot(commands.Bot):
             raise AttributeError(f"CTBot has no attribute '{item}'")
 
     def load(self):
+        self.load_config()
+        self._data.update(self._read_data())
+
+    def load_config(self):
+        with open("config/default_config.json") as f:
+            config = json.load(f)  # Keys added after config.json was written keep their default
         with open("config/config.json") as f:
             old_config = self.config
-            self.config = json.load(f)
+            config.update(json.load(f))
+            self.config = config
             for k in old_config:  # To only add fields, not replace the existing ones
                 self.config[k] = old_config[k]
 
-        for name in self._data:
-            path = Path(f"data/{name}.json")
-            if path.is_file():
-                try:
-                    self._data[name] = json.loads(path.read_text())
-                except json.JSONDecodeError:
-                    print("Load JSON", f"{name}.json didn't finish saving previously and can't be loaded")
-                else:
-                    os.rename(f"data/{name}.json", f"data/{name}.json.incomplete")
-                    path.write_text(json.dumps(self._data[name], ensure_ascii=False))
+        if self.store is None:
+            if self.config["data_backend"] == "sqlite":
+                self.store = SQLiteStore("data")
+                self.store.migrate([*self._data, "levels"])
             else:
-                path.write_text(json.dumps(self._data[name], ensure_ascii=False))
+                self.store = Journal("data")
+                self.store.partition("levels")
+
+    def _read_data(self) -> dict:
+        return {name: self.store.load(name) for name in self._data}
+
+    async def read(self, name: str, convert=dict):
+        """Reads a namespace and passes it to ``convert`` in the storage thread."""
+        return await self.loop.run_in_executor(self._executor, lambda: convert(self.store.load(name)))
+
+    async def run_in_storage(self, func, *args):
+        """Runs ``func(store, *args)`` in the storage thread, after every write queued before it."""
+        return await self.loop.run_in_executor(self._executor, func, self.store, *args)
+
+    def record(self, name: str, *path: str):
+        """Marks the value at ``path`` in the ``name`` namespace as changed.
+
+        Call this after changing the data instead of saving everything,
+        e.g. ``bot.record("levels", guild_id, user_id)``. The change is
+        journaled by the next flush.
+        """
+        if name == "levels":  # Every guild is its own namespace
+            name, path = f"levels/{path[0]}", path[1:]
+        dirty = self._dirty.setdefault(name, {})
+        if path not in dirty:
+            dirty[path] = None
+            self._dirty_count += 1
+            if self._dirty_count >= self.config["save_threshold"]:
+                self._flush_event.set()
+
+    def _snapshot(self) -> dict:
+        """Takes the records of every path changed since the last flush.
+
+        The values are copied, so the storage thread can serialize them while
+        the cogs keep changing the originals.
+        """
+        dirty, self._dirty = self._dirty, {}
+        self._dirty_count = 0
+        changes = {}
+        for name, paths in dirty.items():
+            records = changes[name] = []
+            root = self.levels.get(name[7:], ()) if name.startswith("levels/") else self._data[name]
+            for path in paths:
+                value = root
+                for key in path:
+                    if key not in value:
+                        records.append([list(path)])
+                        break
+                    value = value[key]
+                else:
+                    records.append([list(path), copy.deepcopy(value)])
+        return changes
+
+    def _write(self, changes: dict, compact_threshold: int, release=()):
+        for name, records in changes.items():
+            self.store.append(name, records)
+        for name, size in list(self.store.sizes.items()):
+            if size >= compact_threshold:
+                self.store.compact(name)
+        for name in release:
+            self.store.release(name)
+
+    async def flush(self):
+        """Journals every change since the last flush without blocking the event loop.
+
+        Guilds whose levels have been idle for ``levels_idle_timeout`` seconds are
+        then unloaded, as long as more than ``levels_member_budget`` members are loaded.
+        """
+        dirty = self._dirty
+        # Taken before the snapshot empties _dirty; a failed write restores these changes
+        keep = {name[7:] for name in dirty if name.startswith("levels/")}
+        changes = self._snapshot()
+        evicted = self.levels.evict(
+            self.config["levels_member_budget"],
+            self.config["levels_idle_timeout"],
+            keep=keep,
+        )
+        try:
+            await self.loop.run_in_executor(
+                self._executor,
+                self._write,
+                changes,
+                self.config["compact_threshold"],
+                [f"levels/{guild_id}" for guild_id in evicted],
+            )
+        except Exception:
+            self._restore(dirty)  # Written again by the next flush, records are safe to repeat
+            raise
+
+    def _restore(self, dirty: dict):
+        """Marks the paths of a snapshot that failed to be written as changed again."""
+        for name, paths in dirty.items():
+            self._dirty.setdefault(name, {}).update(paths)
+        self._dirty_count = sum(map(len, self._dirty.values()))
 
     def save(self):
-        for name in self._data:
-            with open(f"data/{name}.json", "w") as f:
-                json.dump(self._data[name], f, ensure_ascii=False)
+        """Flushes pending changes and compacts every namespace, blocking until it's done."""
+        self._executor.submit(self._write, self._snapshot(), 1).result()
+
+    async def flush_task(self):
+        """Flushes changes every ``save_interval`` seconds, or sooner after ``save_threshold`` of them."""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), self.config["save_interval"])
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                await self.flush()
+            except Exception:
+                await self.log("Storage", f"Saving failed:\n```{traceback.format_exc()}```", utils.LogLevel.ERROR)
 
     def run(self):
         super().run(self.config["token"])
 
+    async def close(self):
+        await self.flush()
+        await super().close()
+
     async def reload(self, cog: str):
         """Reloads all extensions."""
         await self.change_presence(
@@ -73,8 +194,7 @@ class CTBot(commands.Bot):
 
         if cog:
             if cog == "config":
-                self.save()
-                self.load()
+                self.load_config()  # The data in memory is newer than what's stored
                 self.command_prefix = self.config["prefix"]
                 await self.log("Reload", "Reloaded config")
             elif "cogs." + cog in self.extensions:
@@ -91,8 +211,7 @@ class CTBot(commands.Bot):
             else:
                 raise ValueError(f"Cog '{cog}' doesn't exist or isn't loaded")
         else:
-            self.save()
-            self.load()
+            self.load_config()  # The data in memory is newer than what's stored
             self.command_prefix = self.config["prefix"]
             await self.log("Reload", "Reloaded config")
             errors = []
@@ -100,7 +100,7 @@ class Appeals(commands.Cog):
                     "cooldown": time() + 60 * 60 * 2,
                     "banned": False,
                 }
-                self.bot.save()
+                self.bot.record("appeal_ban", user_id)
             elif str(reaction.emoji) == "👎":
                 await ctx.send(
                     "Alright, feel free to resubmit with the correct parameters"
@@ -138,7 +138,7 @@ class Appeals(commands.Cog):
                     "cooldown": time() + 60 * 60 * 24 * 2,
                     "banned": False,
                 }
-                self.bot.save()
+                self.bot.record("appeal_ban", target_id)
                 try:
                     await target.send(
                         "Your ban appeal was denied, you can retry in 2 days"
@@ -151,7 +151,7 @@ class Appeals(commands.Cog):
                 )
                 await msg.clear_reactions()
                 self.bot.appeal_ban[target_id] = {"cooldown": None, "banned": True}
-                self.bot.save()
+                self.bot.record("appeal_ban", target_id)
                 try:
                     await target.send(
                         "Your ban appeal was rejected an you've been banned from ban appeals"
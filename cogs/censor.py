@@ -1,5 +1,10 @@
+import asyncio
+import collections
+import hashlib
+import inspect
 import json
-import re
+import os
+from time import monotonic, perf_counter_ns
 
 
 import discord
@@ -8,11 +13,66 @@ from discord.ext import commands
 from profanity_check import predict
 
 from bot import CTBot
+from utils.aho_corasick import LayeredMatcher
+from utils.domains import DomainSet
+from utils.flood import FloodDetector
+from utils.inference import BatchPredictor
+from utils.normalize import fold, fold_words
+from utils.rule_stats import RuleStats, summary
 from utils.utils import LogLevel
 
 
+CONFIG_FILE = "config/censor.json"
+WORDS_FILE = "config/blocked_words.txt"
+DOMAINS_FILE = "config/blocked_domains.txt"
+WATCHED_FILES = CONFIG_FILE, WORDS_FILE, DOMAINS_FILE
+ML_SETTINGS = (
+    "profanity_filter_ml",
+    "profanity_filter_ml_batch_size",
+    "profanity_filter_ml_batch_delay_ms",
+    "profanity_filter_ml_workers",
+)
+FLOOD_SETTINGS = "flood_window", "flood_max_tracked"
+
+MAX_CACHED_EXEMPTIONS = 100000
+AUDIT_CHUNK = 1000  # Members checked between yields to the event loop
+
+# check(content, folded) returns what the message matched, or None when it passes. It may be a coroutine.
+# content is the message as sent, folded has look-alike characters folded to ASCII for the word matchers.
+Rule = collections.namedtuple("Rule", "name check reason warning")
+
+
+def caps_check(content: str, limit: int):
+    caps = sum(map(str.isupper, content))
+    return f"{caps} capitals" if caps >= limit else None
+
+
+def search_words(matcher: LayeredMatcher, folded: str):
+    """Searches folded text read as leetspeak, then as written for list entries with digits like "a54"."""
+    text = fold_words(folded)
+    match = matcher.search(text)
+    if match is None and text != folded:
+        match = matcher.search(folded)
+    return match
+
+
+def update_matcher(matcher: LayeredMatcher, words: list, word_boundaries: bool) -> LayeredMatcher:
+    if matcher is None:
+        return LayeredMatcher.build(words, word_boundaries)
+    return matcher.update(words, word_boundaries)  # Only builds an automaton of the new words when words were just added
+
+
+def modified_times() -> dict:
+    times = {}
+    for path in WATCHED_FILES:
+        try:
+            times[path] = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            times[path] = None
+    return times
+
+
 async def remove_message(message: discord.Message, reason: str, notify: bool = True):
-    # remove_messages may be called multiple times for messages which trigger multiple conditions.
     try:
         await message.delete()
     except discord.errors.NotFound:
@@ -29,43 +89,126 @@ async def remove_message(message: discord.Message, reason: str, notify: bool = T
 class Censor(commands.Cog):
     def __init__(self, bot: CTBot):
         self.bot = bot
-        with open("config/censor.json") as f:
-            self.config = json.load(f)
-        with open("config/blocked_words.txt") as f:
-            bw = f.read()
-            self.blocked_words = bw.split()
-
-            # Create RegEx from censored words file
-            self.blocked_words_regex = re.compile(
-                "|".join(map(re.escape, bw.strip().split('\n'))),
-                flags=re.IGNORECASE
-            )
-
-        domain_str = "(https?://)?(www\.)?"
-        with open("config/blocked_domains.txt", 'r') as f:
-
-            self.blocked_domains_regex = re.compile(
-                f"{domain_str}({'|'.join(map(re.escape, f.read().strip().splitlines()))})",
-                re.IGNORECASE
-            )
+        self.config = None
+        self.blocked_words_matcher = None
+        self.blocked_nicks_matcher = None  # Always matches whole words, a nickname is too short to tell
+        self.blocked_domains = None
+        self.predictor = None
+        self.user_messages = self.user_mentions = self.channel_messages = None
+        self.verdicts = collections.OrderedDict()  # Content digest -> (rule, match) or None, least recently used first
+        self.exemptions = {}  # (guild id, member id) -> whether the member is exempt, until their roles change
+        self.stats = {}  # Rule name -> RuleStats, kept across reloads
+        self.verdict_lookups = self.verdict_hits = 0
+
+        self.modified = modified_times()
+        self.swap_lists(*self.read_lists(WATCHED_FILES))
+        self.watch_task = bot.loop.create_task(self.watch_lists_task())
+        self.stats_task = bot.loop.create_task(self.log_stats_task())
+
+        self.nick_fixes = asyncio.Queue()  # (member, matched word)
+        self.queued_nicks = set()  # (guild id, member id) of every member in nick_fixes
+        self.nick_task = bot.loop.create_task(self.fix_nicks_task())
+
+    def read_lists(self, changed) -> tuple:
+        """Reads the changed files and builds new matchers from them.
+
+        Runs in a worker thread, so it only builds new objects and never
+        changes the ones messages are being checked with.
+        Returns the ``(config, words matcher, nicknames matcher, domains)`` to pass to :meth:`swap_lists`.
+        """
+        config, matcher, domains = self.config, self.blocked_words_matcher, self.blocked_domains
+        nick_matcher = self.blocked_nicks_matcher
+        if CONFIG_FILE in changed:
+            with open(CONFIG_FILE) as f:
+                config = json.load(f)
+            missing = [key for key in self.config or () if key not in config and key != "notes"]
+            if missing:
+                raise KeyError(f"{CONFIG_FILE} is missing {', '.join(missing)}")
+        if WORDS_FILE in changed or config["word_filter_word_boundaries"] != matcher.word_boundaries:
+            with open(WORDS_FILE) as f:
+                words = [fold(word) for word in f.read().split("\n")]  # Not read as leetspeak, "a54" isn't "asa"
+            matcher = update_matcher(matcher, words, config["word_filter_word_boundaries"])
+            nick_matcher = matcher if matcher.word_boundaries else update_matcher(nick_matcher, words, True)
+        if DOMAINS_FILE in changed:
+            domains = DomainSet.load(DOMAINS_FILE)
+        return config, matcher, nick_matcher, domains
+
+    def swap_lists(self, config: dict, matcher: LayeredMatcher, nick_matcher: LayeredMatcher, domains: DomainSet):
+        """Switches to what :meth:`read_lists` built, all at once between two messages.
+
+        Everything is built first and only assigned once nothing can fail
+        anymore, so an invalid config leaves the cog as it was.
+        """
+        predictor = self.predictor
+        new_predictor = self.config is None or any(config[key] != self.config[key] for key in ML_SETTINGS)
+        if new_predictor:
+            predictor = BatchPredictor(
+                predict,
+                config["profanity_filter_ml_batch_size"],
+                config["profanity_filter_ml_batch_delay_ms"] / 1000,
+                config["profanity_filter_ml_workers"],
+            ) if config["profanity_filter_ml"] else None
+        try:
+            detectors = self.user_messages, self.user_mentions, self.channel_messages
+            if self.config is None or any(config[key] != self.config[key] for key in FLOOD_SETTINGS):
+                detectors = tuple(
+                    FloodDetector(config["flood_window"], max_keys=config["flood_max_tracked"]) for _ in range(3)
+                )
+            exempt_users = frozenset(config["word_filter_exception_user_ids"] + config["all_exempt_user_ids"])
+            exempt_roles = frozenset(config["word_filter_exception_role_ids"] + config["all_exempt_roles"])
+            rules = self.compile_rules(config, matcher, domains)
+        except Exception:
+            if new_predictor and predictor:
+                predictor.close()
+            raise
+
+        if new_predictor and self.predictor:
+            self.predictor.close()
+        self.predictor = predictor
+        self.user_messages, self.user_mentions, self.channel_messages = detectors
+        self.config = config
+        self.blocked_words_matcher = matcher
+        self.blocked_nicks_matcher = nick_matcher
+        self.blocked_domains = domains
+        self.exempt_users = exempt_users
+        self.exempt_roles = exempt_roles
+        self.exemptions.clear()
+        self.rules = rules
+        for rule in rules:
+            self.stats.setdefault(rule.name, RuleStats())
+        self.verdicts.clear()
+
+    async def watch_lists_task(self):
+        """Reloads the config and lists ``list_reload_interval`` seconds after they're changed."""
+        while True:
+            await asyncio.sleep(self.config["list_reload_interval"])
+            modified = modified_times()
+            changed = [path for path in WATCHED_FILES if modified[path] != self.modified[path]]
+            if not changed:
+                continue
+
+            self.modified = modified  # A file that fails to load is only retried once it's changed again
+            try:
+                lists = await self.bot.loop.run_in_executor(None, self.read_lists, changed)
+                self.swap_lists(*lists)
+            except Exception as error:
+                await self.bot.log("CENSOR", f"Failed to reload {', '.join(changed)}: {error!r}", LogLevel.ERROR)
+                continue
+            await self.bot.log("CENSOR", f"Reloaded {', '.join(changed)}", LogLevel.INFO)
 
     def should_run(self, author: discord.Member):
-        if author.bot or isinstance(author, discord.User):
+        if author.bot or isinstance(author, discord.User) or not self.config["enabled"]:
             return False
 
-        if (
-                self.config["enabled"]
-                and author.id not in self.config["word_filter_exception_user_ids"]
-                and author.id not in self.config["all_exempt_user_ids"]
-        ):
-            for role in author.roles:
-                if (
-                        role.id in self.config["word_filter_exception_role_ids"]
-                        or role.id in self.config["all_exempt_roles"]
-                ):
-                    return False
-            return True
-        return False
+        key = (author.guild.id, author.id)
+        exempt = self.exemptions.get(key)
+        if exempt is None:
+            if len(self.exemptions) >= MAX_CACHED_EXEMPTIONS:
+                self.exemptions.clear()
+            exempt = self.exemptions[key] = author.id in self.exempt_users or bool(
+                self.exempt_roles and not self.exempt_roles.isdisjoint(role.id for role in author.roles)
+            )
+        return not exempt
 
     @staticmethod
     async def warn(member: discord.member, action: str, content: str):
@@ -73,113 +216,286 @@ class Censor(commands.Cog):
             f"Your recent {action} was removed because {content}."
         )
 
-    @commands.Cog.listener("on_message")
-    @commands.Cog.listener("on_message_edit")
-    async def profanity_filter_ml(self, *args):
-        message = args[-1]
-        if (
-                self.should_run(message.author)
-                and self.config["profanity_filter_ml"]
-                and predict([message.content]) == [1]
-        ):
-            await remove_message(message, "a banned word", notify=self.config['notify_on_censor'])
-            if self.config["warn_on_censor"]:
-                await self.warn(message.author, "message", "it contained a banned word")
+    def compile_rules(self, config: dict, matcher: LayeredMatcher, domains: DomainSet) -> list:
+        """Builds the enabled rules, cheapest first, so most messages stop early."""
+        rules = []
+        if config["message_char_limit"] > 0:
+            rules.append(Rule(
+                "message_char_limit",
+                lambda content, folded: (
+                    f"{len(content)} characters" if len(content) >= config["message_char_limit"] else None
+                ),
+                "too many symbols",
+                "it exceeded the character limit",
+            ))
+        if config["caps_limit_enabled"]:
+            rules.append(Rule(
+                "caps_limit",
+                lambda content, folded: caps_check(content, config["caps_limit"]),
+                "TOO MANY CAPS",
+                "it exceeded the maximum amount of capitalized letters",
+            ))
+        if config["filter_domains"]:
+            rules.append(Rule(
+                "domain_filter",
+                lambda content, folded: domains.search(folded),
+                "a banned URL",
+                None,
+            ))
+        if config["profanity_filter"]:
+            rules.append(Rule(
+                "profanity_filter",
+                lambda content, folded: search_words(matcher, folded),
+                "a banned word",
+                "it contained a banned word",
+            ))
+        if config["profanity_filter_ml"]:
+            rules.append(Rule(
+                "profanity_filter_ml",
+                self.predict,
+                "a banned word",
+                "it contained a banned word",
+            ))
+        return rules
+
+    def cog_unload(self):
+        self.watch_task.cancel()
+        self.stats_task.cancel()
+        self.nick_task.cancel()
+        if self.predictor:
+            self.predictor.close()
+
+    async def predict(self, content: str, folded: str):
+        return "profanity model" if await self.predictor(folded) == 1 else None
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if self.config["flood_filter"] and await self.flood_check(message):
+            return
+        await self.censor(message)
+
+    async def flood_check(self, message: discord.Message) -> bool:
+        """Counts the message towards the flood limits and acts on the ones it crosses.
+
+        Returns whether the author was acted on.
+        """
+        if not self.should_run(message.author):
+            return False
 
-    @commands.Cog.listener("on_message")
-    @commands.Cog.listener("on_message_edit")
-    async def profanity_filter(self, *args):
-        message = args[-1]
+        now = monotonic()
+        author, channel = message.author, message.channel
+        added = len(message.raw_mentions) + len(message.raw_role_mentions)
+        messages = self.user_messages.hit((author.guild.id, author.id), now)
+        mentions = self.user_mentions.hit((author.guild.id, author.id), now, added) if added else 0
+
+        if self.channel_messages.hit(channel.id, now) > self.config["flood_channel_messages"] > 0:
+            slowmode = self.config["flood_channel_slowmode"]
+            if slowmode and channel.slowmode_delay < slowmode:
+                try:
+                    await channel.edit(slowmode_delay=slowmode, reason="Flood protection")
+                except discord.errors.Forbidden:
+                    pass
+                else:
+                    await self.bot.log("CENSOR", f"Turned on slowmode in {channel.mention}", LogLevel.INFO)
+
+        # Only the message that crosses a limit is announced, so a raid isn't answered with as many notices
+        if messages > self.config["flood_user_messages"] > 0:
+            reason, first = "flooding", messages == self.config["flood_user_messages"] + 1
+        elif mentions > self.config["flood_user_mentions"] > 0:
+            reason, first = "mass mentions", mentions - added <= self.config["flood_user_mentions"]
+        else:
+            return False
 
-        if self.should_run(message.author) and self.config["profanity_filter"]:
-            match = self.blocked_words_regex.search(message.content)
-            if match is not None:
-                await remove_message(message, "a banned word", notify=self.config['notify_on_censor'])
-
-                if self.config["warn_on_censor"]:
-                    await self.warn(message.author, "message", "it contained a banned word")
-
-                if self.config["debug"]:
-                    await self.bot.log(
-                        "CENSOR",
-                        f"Removed message \"{message.content}\" for \"{match.group(0)}\"",
-                        LogLevel.DEBUG
-                    )
-
-    @commands.Cog.listener("on_message")
-    @commands.Cog.listener("on_message_edit")
-    async def message_char_limit(self, *args):
-        message = args[-1]
-        if self.should_run(message.author) and 0 < self.config[
-            "message_char_limit"
-        ] <= len(message.content):
-            await remove_message(message, "too many symbols", notify=self.config['notify_on_censor'])
+        await self.flood_action(message, reason, notify=first)
+        return True
+
+    async def flood_action(self, message: discord.Message, reason: str, notify: bool = True):
+        """Takes ``flood_action`` ("delete", "mute", "kick" or "ban") against the author of a message.
+
+        With ``notify`` the channel is told why the message was deleted, if ``notify_on_censor`` is on.
+        """
+        member, action = message.author, self.config["flood_action"]
+        try:
+            if action == "mute":
+                muted = discord.utils.get(member.guild.roles, name="Muted")
+                if muted is not None:
+                    await member.add_roles(muted, reason=f"CENSORED BY CT BOT: {reason}")
+            elif action == "kick":
+                await member.kick(reason=f"CENSORED BY CT BOT: {reason}")
+            elif action == "ban":
+                await member.ban(reason=f"CENSORED BY CT BOT: {reason}", delete_message_days=1)
+        except (discord.errors.Forbidden, discord.errors.NotFound):
+            pass
+
+        if action != "delete":  # The member was dealt with, start counting from zero again
+            self.user_messages.reset((member.guild.id, member.id))
+            self.user_mentions.reset((member.guild.id, member.id))
+        await remove_message(message, reason, notify=notify and self.config["notify_on_censor"] and action == "delete")
+
+        if self.config["debug"]:
+            await self.bot.log(
+                "CENSOR", f"Took flood action {action} against {member} for {reason}", LogLevel.DEBUG
+            )
 
-            if self.config["warn_on_censor"]:
-                await self.warn(message.author, "message", "it exceeded the character limit")
-
-    @commands.Cog.listener("on_message")
-    @commands.Cog.listener("on_message_edit")
-    async def caps_limit(self, *args):
-        message = args[-1]
-        if self.should_run(message.author) and self.config["caps_limit_enabled"]:
-            cap_count = 0
-            for i in message.content:
-                if i.isupper():
-                    cap_count += 1
-            if cap_count >= self.config["caps_limit"]:
-                await remove_message(message, "TOO MANY CAPS", notify=self.config['notify_on_censor'])
-                if self.config["warn_on_censor"]:
-                    await self.warn(
-                        message.author, "message", "it exceeded the maximum amount of capitalized letters"
-                    )
-
-    @commands.Cog.listener("on_message")
-    @commands.Cog.listener("on_message_edit")
-    async def domain_filter(self, *args):
-        message = args[-1]
-        if self.should_run(message.author) and self.config["filter_domains"]:
-
-            match = self.blocked_domains_regex.search(message.content)
-            if match is not None:
-                if self.config["debug"]:
-                    await self.bot.log(
-                        "CENSOR",
-                        f"Message: {message.content} has been blocked because it contains {match.group(0)}."
-                    )
+    @commands.Cog.listener()
+    async def on_message_edit(self, before: discord.Message, after: discord.Message):
+        if before.content != after.content:  # Embeds being added also count as edits
+            await self.censor(after)
 
-                await remove_message(message, "a banned URL", notify=self.config['notify_on_censor'])
+    async def censor(self, message: discord.Message):
+        """Runs the rule chain and removes the message for the first rule it breaks."""
+        if not self.rules or not self.should_run(message.author):
+            return
 
-    @commands.Cog.listener("on_member_update")
-    async def nick_censor(self, _: discord.Member, after: discord.Member):
-        if self.should_run(after) and self.config["nickname_filter_enabled"] and after.nick is not None:
+        verdict = await self.verdict(message.content)
+        if verdict is not None:
+            rule, match = verdict
+            await remove_message(message, rule.reason, notify=self.config['notify_on_censor'])
+
+            if self.config["warn_on_censor"] and rule.warning:
+                await self.warn(message.author, "message", rule.warning)
 
             if self.config["debug"]:
                 await self.bot.log(
-                    "CENSOR", f"Running nickname censor on {after}, nickname {after.nick}",
+                    "CENSOR",
+                    f"Removed message \"{message.content}\" for {rule.name}: \"{match}\"",
                     LogLevel.DEBUG
                 )
 
-            for word in after.nick.lower().split():
-                if word.lower() in self.blocked_words:
-
-                    try:
-                        await after.edit(
-                            nick=None,
-                            reason="CENSORED BY CT BOT",
-                        )
-                    except discord.errors.Forbidden:
-                        return
-
-                    if self.config["warn_on_censor"]:
-                        await self.warn(after, "nickname", "it contained a banned word")
-
-                    if self.config["debug"]:
-                        await self.bot.log(
-                            "CENSOR",
-                            f"nick: {after.nick} has been blocked because it contains {word}",
-                            LogLevel.DEBUG
-                        )
+    async def verdict(self, content: str):
+        """Returns ``(rule, match)`` of the first rule ``content`` breaks, or ``None``.
+
+        Length and capitals are counted on the content as sent, the word and
+        domain rules see it with look-alike characters folded to ASCII and
+        invisible ones removed. Verdicts are cached by a digest of the content,
+        since spam repeats the same text.
+        """
+        key = hashlib.blake2b(content.encode(), digest_size=16).digest()
+        self.verdict_lookups += 1
+        if key in self.verdicts:
+            self.verdict_hits += 1
+            self.verdicts.move_to_end(key)
+            return self.verdicts[key]
+
+        rules = self.rules
+        folded = fold(content)
+        verdict = None
+        for rule in rules:
+            start = perf_counter_ns()
+            match = rule.check(content, folded)
+            if inspect.isawaitable(match):
+                match = await match
+            self.stats[rule.name].record(perf_counter_ns() - start, match is not None)
+            if match is not None:
+                verdict = rule, match
+                break
+
+        if rules is self.rules:  # The lists weren't reloaded while a check was awaited
+            self.verdicts[key] = verdict
+            if len(self.verdicts) > self.config["verdict_cache_size"]:
+                self.verdicts.popitem(last=False)
+        return verdict
+
+    def stats_summary(self) -> str:
+        return (
+            f"{summary(self.stats)}\n\n"
+            f"Cached verdicts used for {self.verdict_hits} of {self.verdict_lookups} messages"
+        )
+
+    async def log_stats_task(self):
+        """Logs the rule stats every ``stats_log_interval`` seconds, unless it's 0."""
+        while True:
+            await asyncio.sleep(self.config["stats_log_interval"] or 60)
+            if self.config["stats_log_interval"] and self.verdict_lookups:
+                await self.bot.log("CENSOR", f"```\n{self.stats_summary()}```", LogLevel.DEBUG)
+
+    @commands.command(name="censor-stats", description="Shows how often each censor rule runs and matches.")
+    @commands.guild_only()
+    @commands.has_permissions(manage_messages=True)
+    async def censor_stats(self, ctx: commands.Context):
+        """Shows the runs, hits and run time percentiles of every censor rule since the cog was loaded."""
+        await ctx.send(f"```\n{self.stats_summary()}```")
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        if before.roles != after.roles:
+            self.exemptions.pop((after.guild.id, after.id), None)
+        if before.nick != after.nick or before.roles != after.roles:
+            await self.nick_censor(after)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        self.exemptions.pop((member.guild.id, member.id), None)
+
+    def blocked_nick(self, member: discord.Member):
+        """Returns the blocked word in a member's nickname, or ``None``."""
+        if member.nick is None or not self.config["nickname_filter_enabled"] or not self.should_run(member):
+            return None
+        return search_words(self.blocked_nicks_matcher, fold(member.nick))
+
+    async def nick_censor(self, member: discord.Member):
+        word = self.blocked_nick(member)
+        if word is not None:
+            self.queue_nick_fix(member, word)
+
+    def queue_nick_fix(self, member: discord.Member, word: str) -> bool:
+        key = (member.guild.id, member.id)
+        if key in self.queued_nicks:
+            return False
+        self.queued_nicks.add(key)
+        self.nick_fixes.put_nowait((member, word))
+        return True
+
+    async def fix_nicks_task(self):
+        """Resets queued nicknames one at a time, ``nickname_fix_interval`` seconds apart."""
+        while True:
+            member, word = await self.nick_fixes.get()
+            self.queued_nicks.discard((member.guild.id, member.id))
+            if self.blocked_nick(member) is None:  # Changed or exempt since it was queued
+                continue
+
+            nick = member.nick
+            try:
+                await member.edit(
+                    nick=None,
+                    reason="CENSORED BY CT BOT",
+                )
+            except discord.errors.HTTPException:
+                await asyncio.sleep(self.config["nickname_fix_interval"])
+                continue
+
+            if self.config["warn_on_censor"]:
+                try:
+                    await self.warn(member, "nickname", "it contained a banned word")
+                except discord.errors.HTTPException:
+                    pass
+
+            if self.config["debug"]:
+                await self.bot.log(
+                    "CENSOR",
+                    f"nick: {nick} has been blocked because it contains {word}",
+                    LogLevel.DEBUG
+                )
+            await asyncio.sleep(self.config["nickname_fix_interval"])
+
+    @commands.command(name="audit-nicknames", description="Resets every blocked nickname in the server.")
+    @commands.guild_only()
+    @commands.has_permissions(manage_nicknames=True)
+    @commands.bot_has_permissions(manage_nicknames=True)
+    async def audit_nicknames(self, ctx: commands.Context):
+        """Checks the nickname of every cached member and queues the blocked ones to be reset."""
+        members = list(ctx.guild.members)
+        queued = 0
+        for i in range(0, len(members), AUDIT_CHUNK):
+            for member in members[i: i + AUDIT_CHUNK]:
+                word = self.blocked_nick(member)
+                if word is not None and self.queue_nick_fix(member, word):
+                    queued += 1
+            await asyncio.sleep(0)
+        await ctx.send(
+            f"Checked {len(members)} members, {queued} nicknames will be reset "
+            f"over about {queued * self.config['nickname_fix_interval']:.0f} seconds"
+        )
 
 
 def setup(bot: CTBot):
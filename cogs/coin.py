@@ -25,7 +25,7 @@ class Coin(commands.Cog):
                     self.bot.coin[user_id] = 0
                 self.bot.coin[user_id] += 1
 
-                self.bot.save()
+                self.bot.record("coin", user_id)
 
             await message.channel.send(
                 f"{message.author.mention}, you just earned a crafting table!"
@@ -1,5 +1,6 @@
-from datetime import datetime, timedelta
+import traceback
 from random import randrange
+from time import perf_counter
 
 import discord
 from discord.ext import commands
@@ -7,61 +8,198 @@ import asyncio
 import collections
 
 from bot import CTBot
+from utils import checks, utils
+from utils.level_store import GuildLevels
 from utils.utils import LogLevel
+from utils.xp_curve import XPCurve, relevel
+
+COOLDOWN = 2 * 60  # Seconds between XP grants
+BATCH_INTERVAL = 5  # Seconds between applying the buffered XP grants
+MAX_PENDING = 10000
+PAGE_SIZE = 10
+
+
+def relevel_stored(store, name: str, curve: XPCurve) -> int:
+    """Relevels a guild that isn't loaded, straight from storage."""
+    members = GuildLevels.from_dict(store.load(name))
+    changed = relevel(members, curve)
+    if changed:
+        store.append(name, [[[str(user_id)], members[user_id]] for user_id in changed])
+        store.release(name)  # Not loaded, so nothing else will write it soon
+    return len(changed)
 
 
 class Levels(commands.Cog):
     def __init__(self, bot: CTBot):
         self.bot = bot
 
-        self.lock = asyncio.Lock()
-        self.guild_locks = collections.defaultdict(asyncio.Lock)
+        self.cooldowns = {}  # (guild id, user id) -> when the member can earn XP again
+        self._prune_at = 1024
+        self.pending = []  # (guild id, member, channel, timestamp) of XP grants not applied yet
+        self._curve = None
+        self._curve_config = None
+
+        self.task = self.bot.loop.create_task(self.apply_task())
+
+    def cog_unload(self):
+        self.task.cancel()
+        self.bot.loop.create_task(self.apply_pending())
+
+    @property
+    def curve(self) -> XPCurve:
+        """The XP curve from the config, rebuilt when the config changes."""
+        if self._curve_config != self.bot.config["xp_curve"]:
+            self._curve = XPCurve(**self.bot.config["xp_curve"])
+            self._curve_config = dict(self.bot.config["xp_curve"])
+        return self._curve
+
+    def prune_cooldowns(self, now: float):
+        """Drops expired cooldowns once the index has doubled in size since the last prune."""
+        if len(self.cooldowns) >= self._prune_at:
+            self.cooldowns = {key: until for key, until in self.cooldowns.items() if until >= now}
+            self._prune_at = max(1024, 2 * len(self.cooldowns))
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
 
         if not message.author.bot and message.guild:
 
-            async with self.lock:
-                if str(message.guild.id) not in self.bot.levels:
-                    self.bot.levels[str(message.guild.id)] = {}
-
-            async with self.guild_locks[str(message.guild.id)]:
-                if str(message.author.id) not in self.bot.levels[str(message.guild.id)]:
-                    self.bot.levels[str(message.guild.id)][str(message.author.id)] = {
-                        "timestamp": 0,
-                        "xp": 0,
-                        "level": 0,
-                    }
-
-                xp = self.bot.levels[str(message.guild.id)][str(message.author.id)]
-
-                if message.created_at - datetime.fromtimestamp(xp["timestamp"]) > timedelta(minutes=2):
-                    rand = randrange(5)
-
-                    if rand == 0:
-                        xp["timestamp"] = message.created_at.timestamp()
-                        add = randrange(10, 16)
-                        xp["xp"] += add
-
-                        if xp["xp"] >= int(200 * 1.32 ** (xp["level"]) - 100):
-                            xp["level"] += 1
-                            await self.bot.log(
-                                "Levels",
-                                f"{message.author.mention} leveled up to {xp['level']}",
-                                LogLevel.DEBUG,
-                            )
-                            await message.channel.send(
-                                f"{message.author.mention}, you leveled up to {xp['level']}!"
-                            )
-
-                        else:
-                            await self.bot.log(
-                                "Levels",
-                                f"Gave {message.author.mention} {add} xp",
-                                LogLevel.DEBUG,
-                            )
-                self.bot.save()
+            # Most messages are on cooldown or lose the 1 in 5 roll, so check that first
+            key = (message.guild.id, message.author.id)
+            now = message.created_at.timestamp()
+            if now <= self.cooldowns.get(key, 0) or randrange(5) or len(self.pending) >= MAX_PENDING:
+                return
+
+            self.cooldowns[key] = now + COOLDOWN
+            self.prune_cooldowns(now)
+            self.pending.append((message.guild.id, message.author, message.channel, now))
+
+    async def apply_task(self):
+        """Applies the buffered XP grants every BATCH_INTERVAL seconds."""
+        while True:
+            await asyncio.sleep(BATCH_INTERVAL)
+            try:
+                await self.apply_pending()
+            except Exception:
+                await self.bot.log("Levels", f"Applying xp failed:\n```{traceback.format_exc()}```", LogLevel.ERROR)
+
+    async def apply_pending(self):
+        """Gives XP for every buffered grant, with one level up message per channel."""
+        batch, self.pending = self.pending, []
+        guilds = collections.defaultdict(list)
+        for grant in batch:
+            guilds[grant[0]].append(grant)
+
+        granted = 0
+        level_ups = collections.defaultdict(list)  # Channel -> messages
+        for guild_id, grants in guilds.items():
+            members = await self.bot.levels.fetch(str(guild_id))
+            for _, member, channel, now in grants:
+                row = members.row(member.id)
+                if now - members.timestamp[row] <= COOLDOWN:  # Not in the index since the bot started
+                    self.cooldowns[guild_id, member.id] = members.timestamp[row] + COOLDOWN
+                    continue
+
+                members.timestamp[row] = now
+                members.add_xp(row, randrange(10, 16))
+                granted += 1
+
+                level = self.curve.level(members.xp[row])
+                if level > members.level[row]:
+                    members.level[row] = level
+                    level_ups[channel].append(f"{member.mention}, you leveled up to {level}!")
+                self.bot.record("levels", str(guild_id), str(member.id))
+
+        if granted:
+            await self.bot.log(
+                "Levels",
+                f"Gave xp to {granted} members, {sum(map(len, level_ups.values()))} leveled up",
+                LogLevel.DEBUG,
+            )
+        for channel, lines in level_ups.items():
+            for i in range(0, len(lines), 20):  # Keeps each message under 2000 characters
+                try:
+                    await channel.send("\n".join(lines[i: i + 20]))
+                except (discord.errors.Forbidden, discord.errors.NotFound):
+                    break
+
+    @commands.command(description="Shows a member's level and rank.")
+    @commands.guild_only()
+    @commands.bot_has_permissions(embed_links=True)
+    async def rank(self, ctx: commands.Context, member: discord.Member = None):
+        """Shows the level, XP and leaderboard position of a member."""
+        member = member or ctx.author
+        members = await self.bot.levels.fetch(str(ctx.guild.id))
+        if member.id not in members:
+            return await ctx.send(f"{member} hasn't earned any xp yet")
+
+        row = members.rows[member.id]
+        e = discord.Embed(color=utils.get_color(ctx.bot))
+        e.set_author(name=str(member), icon_url=member.avatar_url)
+        e.add_field(name="◈ Rank", value=f"#{members.rank(member.id)} of {len(members)}")
+        e.add_field(name="◈ Level", value=str(members.level[row]))
+        e.add_field(name="◈ XP", value=f"{members.xp[row]}/{self.curve.required_xp(members.level[row])}")
+        await ctx.send(embed=e)
+
+    @commands.command(description="Shows the members with the most xp.")
+    @commands.guild_only()
+    @commands.bot_has_permissions(embed_links=True)
+    async def leaderboard(self, ctx: commands.Context, page: int = 1):
+        """Displays the leaderboard, 10 members per page."""
+        members = await self.bot.levels.fetch(str(ctx.guild.id))
+        pages = max(1, -(-len(members) // PAGE_SIZE))
+        page = min(max(page, 1), pages)
+
+        def embed():
+            start = (page - 1) * PAGE_SIZE
+            e = discord.Embed(color=utils.get_color(ctx.bot))
+            e.set_author(name=f"{ctx.guild} Leaderboard", icon_url=ctx.guild.icon_url)
+            e.description = "\n".join(
+                f"`#{start + i}` <@{user_id}> - level {level} ({xp} xp)"
+                for i, (user_id, xp, level) in enumerate(members.top(start, start + PAGE_SIZE), 1)
+            ) or "Nobody has earned any xp yet"
+            e.set_footer(text=f"Page {page}/{pages}")
+            return e
+
+        msg = await ctx.send(embed=embed())
+        if pages == 1:
+            return
+        emojis = ["◀️", "▶️"]
+        for emoji in emojis:
+            await msg.add_reaction(emoji)
+
+        def predicate(react, usr):
+            return react.message.id == msg.id and usr == ctx.author and str(react.emoji) in emojis
+
+        while True:
+            try:
+                reaction, user = await self.bot.wait_for("reaction_add", timeout=60.0, check=predicate)
+            except asyncio.TimeoutError:
+                return await msg.clear_reactions()
+            await msg.remove_reaction(reaction, user)
+            page = max(1, page - 1) if str(reaction.emoji) == emojis[0] else min(pages, page + 1)
+            await msg.edit(embed=embed())
+
+    @commands.command(description="Recomputes every level from the xp curve.")
+    @commands.check(checks.dev)
+    async def relevel(self, ctx: commands.Context):
+        """Recomputes the level of every stored member after the xp curve changed."""
+        await ctx.send("Recomputing levels...")
+        start = perf_counter()
+        curve = self.curve
+        changed = 0
+
+        for guild_id, members in list(self.bot.levels.guilds.items()):
+            for user_id in relevel(members, curve):
+                self.bot.record("levels", guild_id, str(user_id))
+                changed += 1
+
+        for name in await self.bot.run_in_storage(lambda store: store.partitions("levels")):
+            if name[7:] not in self.bot.levels:
+                changed += await self.bot.run_in_storage(relevel_stored, name, curve)
+
+        await self.bot.log("Levels", f"Relevelled {changed} members in {perf_counter() - start:.2f}s")
+        await ctx.send(f"Updated the level of {changed} members")
 
 
 def setup(bot):
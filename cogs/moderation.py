@@ -1,4 +1,7 @@
 import asyncio
+import datetime
+import re
+import shlex
 
 import discord
 from discord.ext import commands
@@ -6,6 +9,13 @@ from discord.ext import commands
 from bot import CTBot
 from utils import utils
 
+BULK_DELETE_SIZE = 100  # Most messages one bulk delete request takes
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14, hours=-1)  # Discord refuses 14 days, an hour spare for slow purges
+SINGLE_DELETE_INTERVAL = 1  # Seconds between deleting older messages one by one
+MAX_PURGE_SCAN = 10000
+AGE_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+AGE_REGEX = re.compile(r"(\d+)([smhdw])")
+
 
 def has_required_permissions(**kwargs):
     """Permission and role check."""
@@ -21,12 +31,20 @@ def has_required_permissions(**kwargs):
         if name.startswith("un"):
             name = name[2:]
         return any(
-            role.id in ctx.bot.config["moderator"][name] for role in ctx.author.roles
+            role.id in ctx.bot.config["moderator"].get(name, ()) for role in ctx.author.roles
         )
 
     return commands.check(predicate)
 
 
+def parse_age(text: str) -> datetime.timedelta:
+    """Parses ages like ``30m``, ``2h`` or ``1d12h``."""
+    parts = AGE_REGEX.findall(text.lower())
+    if not parts or "".join(number + unit for number, unit in parts) != text.lower():
+        raise commands.BadArgument(f"`{text}` isn't an age like 30m, 2h or 7d")
+    return datetime.timedelta(seconds=sum(int(number) * AGE_UNITS[unit] for number, unit in parts))
+
+
 async def moderator_niv(ctx: commands.Context, aid):
     return ctx.author.roles in ctx.bot.config["moderator"] and ctx.author.id != aid
 
@@ -180,6 +198,95 @@ class ModCommands(commands.Cog):
                     await ctx.send("Unban failed")
         await ctx.send("User isn't banned")
 
+    @commands.command(description="Deletes recent messages matching filters.")
+    @commands.cooldown(1, 10, commands.BucketType.channel)
+    @commands.guild_only()
+    @has_required_permissions(manage_messages=True)
+    @commands.bot_has_permissions(embed_links=True, manage_messages=True, read_message_history=True)
+    async def purge(
+        self,
+        ctx: commands.Context,
+        limit: int,
+        users: commands.Greedy[discord.User],
+        *,
+        options: str = "",
+    ):
+        """Deletes the messages among the last ``limit`` in the channel that match every filter given.
+
+        Filters: users to delete the messages of, ``--contains <text>``,
+        ``--attachments``, ``--newer <age>`` and ``--older <age>``, where an
+        age is like ``30m``, ``2h`` or ``7d``. Pinned messages are kept.
+        ``--contains`` ignores case; quote text with spaces.
+        Messages younger than 14 days are deleted 100 per request, older ones
+        one at a time.
+        """
+        limit = min(limit, MAX_PURGE_SCAN)
+        user_ids = {user.id for user in users}
+        contains = None
+        attachments = False
+        newer = older = None
+        try:
+            args = iter(shlex.split(options))
+        except ValueError as error:  # An unbalanced quote
+            raise commands.BadArgument(f"Invalid options: {error}")
+        for arg in args:
+            try:
+                if arg == "--contains":  # Not a regex, one could backtrack for minutes on the event loop
+                    contains = next(args).casefold()
+                elif arg == "--attachments":
+                    attachments = True
+                elif arg == "--newer":
+                    newer = parse_age(next(args))
+                elif arg == "--older":
+                    older = parse_age(next(args))
+                else:
+                    raise commands.BadArgument(f"Unknown option `{arg}`")
+            except StopIteration:
+                raise commands.BadArgument(f"`{arg}` needs a value")
+
+        def matches(message: discord.Message) -> bool:
+            return not message.pinned and (
+                (not user_ids or message.author.id in user_ids)
+                and (contains is None or contains in message.content.casefold())
+                and (not attachments or bool(message.attachments))
+            )
+
+        now = datetime.datetime.utcnow()
+        bulk_after = now - BULK_DELETE_MAX_AGE
+        batch, old = [], []
+        deleted = 0
+        async for message in ctx.channel.history(
+                limit=limit,
+                before=now - older if older else ctx.message,
+                after=now - newer if newer else None,
+                oldest_first=False,
+        ):
+            if not matches(message):
+                continue
+            if message.created_at < bulk_after:
+                old.append(message)
+                continue
+            batch.append(message)
+            if len(batch) == BULK_DELETE_SIZE:
+                await ctx.channel.delete_messages(batch)
+                deleted += len(batch)
+                batch = []
+        if batch:
+            await ctx.channel.delete_messages(batch)
+            deleted += len(batch)
+
+        for message in old:
+            try:
+                await message.delete()
+            except discord.errors.NotFound:
+                continue
+            deleted += 1
+            await asyncio.sleep(SINGLE_DELETE_INTERVAL)
+
+        e = discord.Embed()
+        e.set_author(name=f"Deleted {deleted} messages", icon_url=ctx.author.avatar_url)
+        await ctx.send(embed=e, delete_after=10)
+
     @commands.command(description="Moves a member to the specified channel")
     @commands.bot_has_guild_permissions(embed_links=True, move_members=True)
     @commands.has_guild_permissions(move_members=True)
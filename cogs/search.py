@@ -1,10 +1,14 @@
+import asyncio
 from pathlib import Path
-import re
 
 import discord
 from discord.ext import commands
 
 from bot import CTBot
+from utils import checks
+from utils.term_index import TermIndex
+
+PROGRESS_INTERVAL = 10  # Seconds between updates of the progress message
 
 
 class Search(commands.Cog):
@@ -14,66 +18,148 @@ class Search(commands.Cog):
     def __init__(self, bot: CTBot):
         self.bot = bot
 
-        read = lambda x: str(x.read_text()).lower().strip().split('\n')
+        paths = Path("./firstnames.txt"), Path("./lastnames.txt"), Path("./cities.txt")
+        for path, name in zip(paths, ("firstnames", "lastnames", "cities")):
+            if not path.is_file():
+                raise ValueError(f"We are missing the {name} file.")
 
-        pathln = Path("./lastnames.txt")
-        if pathln.is_file():
-            ln = read(pathln)
-        else:
-            raise ValueError("We are missing the lastnames file.")
-
-        pathfn = Path("./firstnames.txt")
-        if pathfn.is_file():
-            fn = [x.split(",", 1)[0] for x in read(pathfn)]
-        else:
-            raise ValueError("We are missing the firstnames file.")
+        Path("./data").mkdir(exist_ok=True)
+        self.terms = TermIndex.cached(
+            "./data/search_terms.json", paths, lambda: self.build_terms(*paths), self.other_words
+        )
 
-        pathcn = Path("./cities.txt")
-        if pathcn.is_file():
-            cn = read(pathcn)
-        else:
-            raise ValueError("We are missing the cities file.")
+    def build_terms(self, pathfn: Path, pathln: Path, pathcn: Path) -> TermIndex:
+        read = lambda x: str(x.read_text()).lower().strip().split('\n')
 
-        search_terms = filter(lambda x: x, map(str.strip, fn + ln + cn + self.other_words))
-        self.regex = re.compile(
-            f"\\b({'|'.join(search_terms)})\\b",
-            flags=re.IGNORECASE
-        )
+        fn = [x.split(",", 1)[0] for x in read(pathfn)]
+        ln = read(pathln)
+        cn = read(pathcn)
+        return TermIndex.build(fn + ln + cn + self.other_words)
 
     @commands.command(description="Find TOS-breaking content in the channel.")
-    async def search(self, ctx: commands.Context, guild_id: int):
-        await ctx.send("starting the `TOS BREAKING SEARCH`")
-        delmsg = None
-        delcnt = 0
-
+    @commands.check(checks.dev)
+    async def search(self, ctx: commands.Context, guild_id: int, *flags: str):
+        """Scans every text channel of a server and removes the messages containing search terms.
+
+        Channels are scanned a few at a time, oldest message first, and a scan
+        continues where the last one stopped. ``--restart`` scans everything
+        again and ``--dry-run`` writes the matches to a report file instead of
+        removing them.
+        """
         guild = self.bot.get_guild(guild_id)
-        channels = guild.text_channels
-
-        for channel in channels:
-            messages = channel.history(limit=None)
-
-            async for message in messages:
-                msg = str(message.content)
-
-                if self.regex.search(msg) is not None:
-                    delcnt += 1
-                    delmsg = True
-
-                    await message.delete()
-
-        if delmsg:
+        if guild is None:
+            return await ctx.send("I'm not in that server.")
+
+        dry_run = "--dry-run" in flags
+        mode = "dry_run" if dry_run else "delete"
+        checkpoints = self.bot.search_checkpoints.setdefault(str(guild_id), {}).setdefault(mode, {})
+        if "--restart" in flags:
+            checkpoints.clear()
+            self.bot.record("search_checkpoints", str(guild_id), mode)
+
+        report = None
+        if dry_run:
+            report_path = Path(f"./data/search_reports/{guild_id}.txt")
+            report_path.parent.mkdir(parents=True, exist_ok=True)
+            report = open(report_path, "a" if checkpoints else "w", encoding="utf-8")
+
+        await ctx.send("starting the `TOS BREAKING SEARCH`" + (" (dry run)" if dry_run else ""))
+        progress = ScanProgress(len(guild.text_channels))
+        status = await ctx.send(progress.describe())
+        semaphore = asyncio.Semaphore(self.bot.config["search_concurrency"])
+        tasks = [
+            asyncio.ensure_future(
+                self.scan_channel(channel, checkpoints, mode, ctx.message, semaphore, progress, report)
+            )
+            for channel in guild.text_channels
+        ]
+
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=PROGRESS_INTERVAL, return_when=asyncio.FIRST_EXCEPTION
+                )
+                if report is not None:
+                    report.flush()
+                await status.edit(content=progress.describe())
+                for task in done:
+                    if not task.cancelled() and task.exception():
+                        raise task.exception()  # The other scans are cancelled below
+        finally:
+            for task in pending:
+                task.cancel()
+            if report is not None:
+                report.close()
+
+        if dry_run:
+            await ctx.send(
+                f"Found {progress.matched} messages, see the report.", file=discord.File(str(report_path))
+            )
+        elif progress.matched:
             embed = discord.Embed(
                 title="Removed Messages (TOS Safety)",
                 description="Messages were removed for" "breaking the TOS",
                 color=0xFF2103,
             )
-            embed.add_field(name="Count:", value=str(delcnt), inline=False)
+            embed.add_field(name="Count:", value=str(progress.matched), inline=False)
             embed.add_field(name="Issuer", value=str(ctx.author.name), inline=False)
             embed.set_thumbnail(url=ctx.author.avatar_url)
             await ctx.send(embed=embed)
         else:
             await ctx.send("No content in violation of the TOS was found.")
 
+    async def scan_channel(
+            self,
+            channel: discord.TextChannel,
+            checkpoints: dict,
+            mode: str,
+            before: discord.Message,
+            semaphore: asyncio.Semaphore,
+            progress: "ScanProgress",
+            report=None,
+    ):
+        """Scans a channel from its checkpoint up to ``before``, saving the checkpoint after every message."""
+        key = str(channel.id)
+        async with semaphore:
+            after = discord.Object(checkpoints[key]) if key in checkpoints else None
+            try:
+                async for message in channel.history(limit=None, after=after, before=before, oldest_first=True):
+                    progress.scanned += 1
+                    term = self.terms.search(message.content)
+                    if term is not None:
+                        progress.matched += 1
+                        if report is None:
+                            try:
+                                await message.delete()
+                            except (discord.errors.NotFound, discord.errors.Forbidden):
+                                pass
+                        else:
+                            report.write(
+                                f"{message.created_at:%Y-%m-%d %H:%M} #{channel} {message.author} "
+                                f"({message.author.id}) [{term}] {message.jump_url}\n    {message.content!r}\n"
+                            )
+                    checkpoints[key] = message.id
+                    self.bot.record("search_checkpoints", str(channel.guild.id), mode, key)
+            except discord.errors.Forbidden:
+                progress.skipped += 1
+        progress.done += 1
+
+
+class ScanProgress:
+    __slots__ = ("channels", "done", "skipped", "scanned", "matched")
+
+    def __init__(self, channels: int):
+        self.channels = channels
+        self.done = self.skipped = self.scanned = self.matched = 0
+
+    def describe(self) -> str:
+        skipped = f", {self.skipped} without access" if self.skipped else ""
+        return (
+            f"Scanned {self.done}/{self.channels} channels{skipped}: "
+            f"{self.scanned} messages, {self.matched} matches"
+        )
+
 
 def setup(bot: CTBot):
     bot.add_cog(Search(bot))
@@ -104,8 +104,8 @@ def main():
             log("Login", f"Login failed:\n{traceback.format_exc()}", LogLevel.ERROR)
             return
         except SystemExit:
+            bot.save()  # Final flush of anything still waiting for the flush task
             log("Stop", "Stopped bot")
-            bot.save()
             logfile.close()
             with open("latest.log") as latest, open(log_name, "wb+") as compressed:
                 compressed.write(compress(latest.read()))
@@ -0,0 +1,116 @@
+from collections import deque
+
+
+class AhoCorasick:
+    """Matches a whole list of words against a text in a single pass.
+
+    Words and texts are case folded. With ``word_boundaries`` a word only
+    matches when it isn't part of a longer word, like ``\\bword\\b`` in a regex.
+    """
+
+    def __init__(self, words=(), word_boundaries: bool = False):
+        self.word_boundaries = word_boundaries
+        self.goto = [{}]  # Trie edges of every node, the root is node 0
+        self.fail = [0]
+        self.out = [()]  # Words ending at every node, including through fail links
+        self.words = set()
+        for word in words:
+            word = word.strip().casefold()
+            if word:
+                self._insert(word)
+        self._link()
+
+    def __len__(self):
+        return len(self.words)
+
+    def _insert(self, word: str):
+        node = 0
+        for char in word:
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = self.goto[node][char] = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(())
+            node = next_node
+        if word not in self.words:
+            self.words.add(word)
+            self.out[node] += (word,)
+
+    def _link(self):
+        """Computes the fail links breadth first, merging the words of each node's fallback."""
+        queue = deque(self.goto[0].values())  # Their fail links point at the root
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+                queue.append(child)
+
+    def search(self, text: str):
+        """Returns the first word found in ``text``, or ``None``."""
+        text = text.casefold()
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                if not self.word_boundaries:
+                    return out[node][0]
+                for word in out[node]:
+                    if is_bounded(text, end - len(word), end):
+                        return word
+        return None
+
+
+def is_bounded(text: str, start: int, end: int) -> bool:
+    """Checks that ``text[start:end]`` isn't directly next to another word character."""
+    return (start == 0 or not is_word_char(text[start - 1])) and (end == len(text) or not is_word_char(text[end]))
+
+
+def is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class LayeredMatcher:
+    """An :class:`AhoCorasick` automaton plus a small one of the words added after it was built.
+
+    :meth:`update` returns a new matcher and never changes the automatons of
+    this one, so it can be built in another thread while this one is in use.
+    """
+
+    def __init__(self, base: AhoCorasick, added: AhoCorasick = None):
+        self.base = base
+        self.added = added
+        self.word_boundaries = base.word_boundaries
+        self.words = base.words | added.words if added else base.words
+
+    @classmethod
+    def build(cls, words, word_boundaries: bool = False) -> "LayeredMatcher":
+        return cls(AhoCorasick(words, word_boundaries))
+
+    def __len__(self):
+        return len(self.words)
+
+    def search(self, text: str):
+        """Returns the first word found in ``text``, or ``None``."""
+        return self.base.search(text) or (self.added.search(text) if self.added else None)
+
+    def update(self, words, word_boundaries: bool, max_added: int = 1000) -> "LayeredMatcher":
+        """Returns a matcher of ``words``, reusing the base automaton when words were only added.
+
+        Removed words, a change of ``word_boundaries`` or more than ``max_added``
+        new words rebuild everything from scratch.
+        """
+        words = {word.strip().casefold() for word in words} - {""}
+        if words == self.words and word_boundaries == self.word_boundaries:
+            return self
+        added = words - self.base.words
+        if word_boundaries != self.word_boundaries or len(added) > max_added or not self.base.words <= words:
+            return self.build(words, word_boundaries)
+        return LayeredMatcher(self.base, AhoCorasick(added, word_boundaries) if added else None)
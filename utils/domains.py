@@ -0,0 +1,92 @@
+import re
+
+# Whitespace and punctuation that can't be part of a URL's host, like the brackets or quotes around one
+SEPARATOR_REGEX = re.compile(r"[\s<>()\[\]{}\"'`,;!|*]+")
+SCHEME_REGEX = re.compile(r"[a-z][a-z0-9+.-]*://", re.IGNORECASE)
+# Only matched at the start of a word, and labels are at most 63 characters, so it can't backtrack for long
+HOST_REGEX = re.compile(r"(?:[\w-]{1,63}\.)+[\w-]{2,63}")
+
+
+def normalize_host(host: str) -> str:
+    """Lower cases a host, drops its trailing dot and converts international names to punycode."""
+    host = host.strip().rstrip(".").lower()
+    if not host.isascii():
+        try:
+            host = host.encode("idna").decode("ascii")
+        except UnicodeError:
+            pass
+    return host
+
+
+class DomainSet:
+    """Blocked domains, which also block all of their subdomains.
+
+    A host is looked up by each of its suffixes, ``a.b.example.com``,
+    ``b.example.com``, ``example.com`` and ``com``, so the cost depends on the
+    number of labels in the host and not on the number of blocked domains.
+    """
+
+    def __init__(self, domains=()):
+        self.domains = set()
+        for domain in domains:
+            self.add(domain)
+
+    @classmethod
+    def load(cls, path: str) -> "DomainSet":
+        """Reads one domain per line, streaming the file; blank lines and ``#`` comments are skipped."""
+        blocked = cls()
+        with open(path) as f:
+            for line in f:
+                if not line.startswith("#"):
+                    blocked.add(line)
+        return blocked
+
+    def __len__(self):
+        return len(self.domains)
+
+    def __contains__(self, host: str):
+        return self.match(host) is not None
+
+    def add(self, domain: str):
+        domain = normalize_host(domain.split("://")[-1].split("/")[0])
+        if domain:
+            self.domains.add(domain)
+
+    def match(self, host: str):
+        """Returns the blocked domain ``host`` is or is a subdomain of, or ``None``."""
+        host = normalize_host(host)
+        domains = self.domains
+        while True:
+            if host in domains:
+                return host
+            dot = host.find(".")
+            if dot < 0:
+                return None
+            host = host[dot + 1:]
+
+    def search(self, text: str):
+        """Returns the first host in ``text`` that's blocked, or ``None``."""
+        if not self.domains or "." not in text:
+            return None
+        for host in hosts(text):
+            if self.match(host) is not None:
+                return host
+        return None
+
+
+def hosts(text: str):
+    """Yields the hosts of URLs with or without a scheme, like "https://user@www.example.com:80/path" or "example.com".
+
+    The text is split into words first and each word is matched from its
+    start, so a long message costs linear time whatever it contains.
+    """
+    for word in SEPARATOR_REGEX.split(text):
+        if "." not in word:
+            continue
+        scheme = SCHEME_REGEX.match(word)
+        if scheme:
+            word = word[scheme.end():]
+        authority = word.split("/", 1)[0].split("?", 1)[0].split("#", 1)[0]
+        host = HOST_REGEX.match(authority.rpartition("@")[2])
+        if host:
+            yield host.group()
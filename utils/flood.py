@@ -0,0 +1,72 @@
+import collections
+from array import array
+
+
+class RateWindow:
+    """Counts events over the last ``window`` seconds in a ring of ``buckets`` time slots.
+
+    Old slots are zeroed as time moves past them, so the count is never more
+    than one slot, ``window / buckets`` seconds, out of date.
+    """
+
+    __slots__ = ("counts", "width", "slot", "total")
+
+    def __init__(self, window: float, buckets: int, now: float):
+        self.counts = array("I", bytes(4 * buckets))
+        self.width = window / buckets
+        self.slot = int(now / self.width)  # Absolute number of the newest slot
+        self.total = 0
+
+    def add(self, now: float, amount: int = 1) -> int:
+        """Counts ``amount`` events at ``now`` and returns the count over the window."""
+        slot = int(now / self.width)
+        buckets = len(self.counts)
+        if slot - self.slot >= buckets:
+            self.counts = array("I", bytes(4 * buckets))
+            self.total = 0
+        else:
+            for expired in range(self.slot + 1, slot + 1):
+                self.total -= self.counts[expired % buckets]
+                self.counts[expired % buckets] = 0
+        self.slot = max(slot, self.slot)
+        self.counts[self.slot % buckets] += amount
+        self.total += amount
+        return self.total
+
+
+class FloodDetector:
+    """A :class:`RateWindow` per key, such as a user or channel id.
+
+    Keys that saw no events for a whole window are dropped as new events come
+    in, and at most ``max_keys`` are kept, so a raid can't grow it without bound.
+    """
+
+    def __init__(self, window: float, buckets: int = 10, max_keys: int = 50000):
+        self.window = window
+        self.buckets = buckets
+        self.max_keys = max_keys
+        self.rates = collections.OrderedDict()  # Least recently seen first
+
+    def __len__(self):
+        return len(self.rates)
+
+    def hit(self, key, now: float, amount: int = 1) -> int:
+        """Counts ``amount`` events for ``key`` and returns its count over the window."""
+        rate = self.rates.get(key)
+        if rate is None:
+            self._evict(now)
+            rate = self.rates[key] = RateWindow(self.window, self.buckets, now)
+        else:
+            self.rates.move_to_end(key)
+        return rate.add(now, amount)
+
+    def reset(self, key):
+        self.rates.pop(key, None)
+
+    def _evict(self, now: float):
+        rates = self.rates
+        while rates:
+            key, rate = next(iter(rates.items()))
+            if len(rates) < self.max_keys and (now / rate.width) - rate.slot < self.buckets:
+                break
+            del rates[key]
@@ -0,0 +1,68 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+
+def predict_batch(predict, texts: list) -> list:
+    """Runs in a worker process, so the model is loaded once per worker."""
+    return [int(verdict) for verdict in predict(texts)]
+
+
+class BatchPredictor:
+    """Runs a ``predict(texts)`` model on micro-batches in a process pool.
+
+    Texts are gathered until ``max_batch`` are waiting or the oldest has waited
+    ``max_delay`` seconds, then the whole batch is sent to a worker. The event
+    loop only waits on futures, never on the model itself. ``predict`` has to
+    be picklable, such as a module level function.
+    """
+
+    def __init__(self, predict, max_batch: int = 32, max_delay: float = 0.01, workers: int = 1):
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.pool = ProcessPoolExecutor(workers)
+        self.pending = []  # (text, future)
+        self._timer = None
+
+    async def __call__(self, text: str) -> int:
+        """Returns the model's verdict for a single text."""
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self.pending.append((text, future))
+        if len(self.pending) >= self.max_batch:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        result = asyncio.get_event_loop().run_in_executor(
+            self.pool, predict_batch, self.predict, [text for text, _ in batch]
+        )
+        result.add_done_callback(lambda done: self._resolve(batch, done))
+
+    @staticmethod
+    def _resolve(batch: list, done: asyncio.Future):
+        error = asyncio.CancelledError() if done.cancelled() else done.exception()
+        verdicts = done.result() if error is None else None
+        for i, (_, future) in enumerate(batch):
+            if future.done():  # The message's check was cancelled
+                continue
+            if error is None:
+                future.set_result(verdicts[i])
+            else:
+                future.set_exception(error)
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        for _, future in self.pending:
+            future.cancel()
+        self.pending = []
+        self.pool.shutdown(wait=False)
@@ -0,0 +1,136 @@
+import collections
+import json
+import os
+from pathlib import Path
+
+MAX_OPEN_LOGS = 64  # Least recently written logs are closed past this, so many guilds can't run out of files
+
+
+class Journal:
+    """Append-only storage for the bot's data namespaces.
+
+    Every namespace is kept as a snapshot (``data/<name>.json``) and a log of the
+    changes made since that snapshot was written (``data/<name>.log``). A change
+    is one JSON line, ``[path]`` for a removed key or ``[path, value]`` for a new
+    value, so recording it costs the same however big the namespace grows.
+    Compacting folds the log back into the snapshot, which is replaced
+    atomically so a crash never leaves a half-written file behind.
+
+    A journal isn't thread-safe; the bot only uses it from its storage thread.
+    """
+
+    def __init__(self, directory: str = "data"):
+        self.directory = Path(directory)
+        self.directory.mkdir(exist_ok=True)
+        self.sizes = {}  # Records appended to each log since the last compaction
+        self._logs = collections.OrderedDict()  # Open log files, least recently written first
+
+    def _path(self, name: str, suffix: str) -> Path:
+        return self.directory / f"{name}.{suffix}"
+
+    def load(self, name: str) -> dict:
+        """Reads the snapshot of a namespace and replays its log on top of it."""
+        data = {}
+        path = self._path(name, "json")
+        if path.is_file():
+            data = json.loads(path.read_text())
+
+        count = 0
+        path = self._path(name, "log")
+        if path.is_file():
+            good = 0  # Byte offset of the end of the last complete record
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError
+                        path_, *value = json.loads(line)
+                    except ValueError:
+                        break  # The bot stopped while this record was being written
+                    apply(data, path_, value)
+                    count += 1
+                    good += len(line)
+            if good < path.stat().st_size:
+                # Cut off the torn record, or the next append would continue its line and be lost with it
+                self.release(name)
+                with open(path, "r+b") as f:
+                    f.truncate(good)
+        self.sizes[name] = count
+        return data
+
+    def partition(self, name: str):
+        """Splits a namespace into one ``<name>/<key>`` namespace per top-level key.
+
+        Does nothing unless the old single-file namespace still exists, which is
+        renamed to ``.migrated`` once every partition has been written.
+        """
+        if not (self._path(name, "json").is_file() or self._path(name, "log").is_file()):
+            return
+        for key, value in self.load(name).items():
+            self.append(f"{name}/{key}", [[[k], v] for k, v in value.items()])
+            self.compact(f"{name}/{key}")
+        for suffix in "json", "log":
+            path = self._path(name, suffix)
+            if path.is_file():
+                os.rename(path, self._path(name, f"{suffix}.migrated"))
+        self.sizes.pop(name, None)
+
+    def partitions(self, name: str) -> list:
+        """Returns the ``<name>/<key>`` namespaces made by :meth:`partition`."""
+        keys = {path.stem for suffix in ("json", "log") for path in self.directory.glob(f"{name}/*.{suffix}")}
+        return [f"{name}/{key}" for key in sorted(keys)]
+
+    def append(self, name: str, records: list):
+        """Appends a batch of ``[path]``/``[path, value]`` records to the log of a namespace."""
+        f = self._logs.get(name)
+        if f is None:
+            if len(self._logs) >= MAX_OPEN_LOGS:
+                self._logs.popitem(last=False)[1].close()
+            self._path(name, "log").parent.mkdir(exist_ok=True)
+            f = self._logs[name] = open(self._path(name, "log"), "a")
+        else:
+            self._logs.move_to_end(name)
+        f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        f.flush()
+        self.sizes[name] = self.sizes.get(name, 0) + len(records)
+
+    def compact(self, name: str):
+        """Folds the log of a namespace into a fresh snapshot and empties it.
+
+        Only the files are read, so the live data doesn't have to be copied.
+        Replaying the log again after a crash before it's emptied is harmless.
+        """
+        if name in self._logs:
+            self._logs.pop(name).close()
+        data = self.load(name)
+        path = self._path(name, "json")
+        path.parent.mkdir(exist_ok=True)
+        tmp = self._path(name, "json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        open(self._path(name, "log"), "w").close()
+        self.sizes[name] = 0
+
+    def release(self, name: str):
+        """Closes the log of a namespace that won't be written for a while."""
+        if name in self._logs:
+            self._logs.pop(name).close()
+
+    def close(self):
+        for f in self._logs.values():
+            f.close()
+        self._logs.clear()
+
+
+def apply(data: dict, path, value: list):
+    """Applies a log record to ``data``; an empty ``value`` removes the key."""
+    *parents, key = path
+    for parent in parents:
+        data = data.setdefault(parent, {})
+    if value:
+        data[key] = value[0]
+    else:
+        data.pop(key, None)
@@ -0,0 +1,164 @@
+import asyncio
+import collections
+from array import array
+from time import monotonic
+
+from sortedcontainers import SortedList
+
+
+class GuildLevels:
+    """Level data of the members of one guild, stored column-wise.
+
+    ``rows`` maps a user id to its row in the typed ``timestamp``, ``xp`` and
+    ``level`` arrays, which takes a fraction of the memory of a dict per member.
+    Indexing by user id returns the member as a ``{"timestamp", "xp", "level"}``
+    dict, the format that's written to storage.
+
+    ``order`` keeps every member sorted by XP, so ranks and leaderboard pages
+    cost O(log n). XP must be changed through :meth:`add_xp` to keep it in sync.
+    """
+
+    __slots__ = ("rows", "ids", "timestamp", "xp", "level", "order")
+
+    def __init__(self):
+        self.rows = {}
+        self.ids = array("Q")
+        self.timestamp = array("d")
+        self.xp = array("q")
+        self.level = array("i")
+        self.order = SortedList()
+
+    @classmethod
+    def from_dict(cls, members: dict) -> "GuildLevels":
+        guild = cls()
+        for user_id, member in members.items():
+            guild.rows[int(user_id)] = len(guild.ids)
+            guild.ids.append(int(user_id))
+            guild.timestamp.append(member["timestamp"])
+            guild.xp.append(member["xp"])
+            guild.level.append(member["level"])
+        guild.order = SortedList(map(order_key, guild.xp, guild.ids))  # Sorting once beats n inserts
+        return guild
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, user_id):
+        return int(user_id) in self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __getitem__(self, user_id) -> dict:
+        row = self.rows[int(user_id)]
+        return {"timestamp": self.timestamp[row], "xp": self.xp[row], "level": self.level[row]}
+
+    def __setitem__(self, user_id, member: dict):
+        row = self.row(int(user_id))
+        self.timestamp[row] = member["timestamp"]
+        self.add_xp(row, member["xp"] - self.xp[row])
+        self.level[row] = member["level"]
+
+    def row(self, user_id: int) -> int:
+        """Returns the row of a member, adding an empty one if they're new."""
+        row = self.rows.get(user_id)
+        if row is None:
+            row = self.rows[user_id] = len(self.ids)
+            self.ids.append(user_id)
+            self.timestamp.append(0)
+            self.xp.append(0)
+            self.level.append(0)
+            self.order.add(order_key(0, user_id))
+        return row
+
+    def add_xp(self, row: int, amount: int):
+        if amount:
+            self.order.remove(order_key(self.xp[row], self.ids[row]))
+            self.xp[row] += amount
+            self.order.add(order_key(self.xp[row], self.ids[row]))
+
+    def rank(self, user_id: int) -> int:
+        """Returns the 1-based position of a member on the leaderboard."""
+        row = self.rows[user_id]
+        return self.order.bisect_left(order_key(self.xp[row], user_id)) + 1
+
+    def top(self, start: int, stop: int) -> list:
+        """Returns ``(user_id, xp, level)`` of the members ranked ``start + 1`` to ``stop``."""
+        members = []
+        for key in self.order.islice(start, stop):
+            row = self.rows[key & ID_MASK]
+            members.append((self.ids[row], self.xp[row], self.level[row]))
+        return members
+
+
+ID_MASK = (1 << 64) - 1
+
+
+def order_key(xp: int, user_id: int) -> int:
+    """Packs XP (descending) and user id (ascending) into one int, smaller than a tuple."""
+    return -xp << 64 | user_id
+
+
+class LevelStore:
+    """Level data of every guild, kept in memory one guild at a time.
+
+    Each guild is its own storage namespace, ``levels/<guild_id>``. It's read
+    the first time :meth:`fetch` asks for it and dropped again by :meth:`evict`
+    once it's been idle for a while and too many members are loaded.
+    """
+
+    def __init__(self, read):
+        self.read = read  # Coroutine function reading and converting a namespace from storage
+        self.guilds = collections.OrderedDict()  # Least recently used first
+        self.last_used = {}
+        self._loading = {}
+
+    def __contains__(self, guild_id: str):
+        return guild_id in self.guilds
+
+    def __getitem__(self, guild_id: str) -> GuildLevels:
+        return self.guilds[guild_id]
+
+    def __len__(self):
+        return len(self.guilds)
+
+    def get(self, guild_id: str, default=None):
+        return self.guilds.get(guild_id, default)
+
+    def members(self) -> int:
+        return sum(map(len, self.guilds.values()))
+
+    async def fetch(self, guild_id: str) -> GuildLevels:
+        """Returns the members of a guild, reading them from storage if they aren't loaded."""
+        if guild_id not in self.guilds:
+            if guild_id not in self._loading:
+                self._loading[guild_id] = asyncio.ensure_future(
+                    self.read(f"levels/{guild_id}", GuildLevels.from_dict)
+                )
+            try:
+                members = await asyncio.shield(self._loading[guild_id])
+            finally:
+                self._loading.pop(guild_id, None)
+            self.guilds.setdefault(guild_id, members)
+        self.guilds.move_to_end(guild_id)
+        self.last_used[guild_id] = monotonic()
+        return self.guilds[guild_id]
+
+    def evict(self, budget: int, idle_timeout: float, keep=()) -> list:
+        """Drops guilds idle for ``idle_timeout`` seconds while more than ``budget`` members are loaded.
+
+        Guilds in ``keep`` have changes that aren't saved yet and are never dropped.
+        Returns the ids of the dropped guilds.
+        """
+        evicted = []
+        members = self.members()
+        now = monotonic()
+        for guild_id in list(self.guilds):
+            if members <= budget or now - self.last_used[guild_id] < idle_timeout:
+                break
+            if guild_id in keep:
+                continue
+            members -= len(self.guilds.pop(guild_id))
+            del self.last_used[guild_id]
+            evicted.append(guild_id)
+        return evicted
@@ -0,0 +1,72 @@
+import re
+import unicodedata
+
+# Letters from other scripts that look like latin ones but don't decompose to them
+HOMOGLYPHS = {
+    "а": "a", "в": "b", "е": "e", "к": "k", "м": "m", "н": "h", "о": "o", "р": "p", "с": "c", "т": "t",
+    "у": "y", "х": "x", "і": "i", "ј": "j", "ѕ": "s", "ԁ": "d", "ԛ": "q", "ԝ": "w", "ɡ": "g", "ı": "i",
+    "А": "A", "В": "B", "Е": "E", "К": "K", "М": "M", "Н": "H", "О": "O", "Р": "P", "С": "C", "Т": "T",
+    "У": "Y", "Х": "X", "І": "I", "Ј": "J", "Ѕ": "S",
+    "α": "a", "ε": "e", "ι": "i", "κ": "k", "ν": "v", "ο": "o", "ρ": "p", "τ": "t", "υ": "u", "χ": "x",
+    "Α": "A", "Β": "B", "Ε": "E", "Ζ": "Z", "Η": "H", "Ι": "I", "Κ": "K", "Μ": "M", "Ν": "N", "Ο": "O",
+    "Ρ": "P", "Τ": "T", "Υ": "Y", "Χ": "X",
+    "ł": "l", "Ł": "L", "ø": "o", "Ø": "O", "đ": "d", "Đ": "D", "ħ": "h", "Ħ": "H", "ŧ": "t", "Ŧ": "T",
+}
+LEETSPEAK = {"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s"}
+REGIONAL_INDICATOR_A = 0x1F1E6  # The flag letters, 🇦 to 🇿
+
+
+def build_fold_table() -> dict:
+    """Maps every non-ASCII character that stands in for ASCII letters or digits to them.
+
+    Covers compatibility forms (fullwidth, mathematical, circled and squared
+    letters, ligatures), accented letters, homoglyphs and flag letters, and
+    removes invisible characters and combining marks.
+    """
+    table = {}
+    for code in range(0x80, 0x20000):
+        char = chr(code)
+        category = unicodedata.category(char)
+        if category in ("Mn", "Me", "Cf"):  # Combining marks, zero-width characters and the like
+            table[code] = None
+            continue
+        folded = "".join(
+            c for c in unicodedata.normalize("NFKD", char) if unicodedata.category(c) not in ("Mn", "Me")
+        )
+        if folded != char and folded.isascii() and folded.isalnum():
+            table[code] = folded
+    for code in range(26):
+        table[REGIONAL_INDICATOR_A + code] = chr(ord("A") + code)
+    table.update(str.maketrans(HOMOGLYPHS))
+    return table
+
+
+FOLD = build_fold_table()
+LEETSPEAK_TABLE = str.maketrans(LEETSPEAK)
+# Words with at least one leetspeak character; the lookbehind stops it from starting mid-word
+LEETSPEAK_WORD_REGEX = re.compile(r"(?<![\w@$])[\w@$]*[013457@$][\w@$]*")
+LEETSPEAK_CHAR_REGEX = re.compile(r"[013457@$]")
+
+
+def fold(text: str) -> str:
+    """Replaces look-alike characters with ASCII and strips invisible ones, in one ``str.translate``."""
+    return text.translate(FOLD)
+
+
+def fold_words(text: str) -> str:
+    """Like :func:`fold`, also reading leetspeak digits and symbols as letters. Only for matching words.
+
+    Leetspeak is only read in words that have letters too, like "p0rn", so
+    numbers such as "455" are left alone.
+    """
+    text = text.translate(FOLD)
+    if not LEETSPEAK_CHAR_REGEX.search(text):  # Most messages, no need to look at every word
+        return text
+    return LEETSPEAK_WORD_REGEX.sub(_read_leetspeak, text)
+
+
+def _read_leetspeak(match) -> str:
+    word = match.group()
+    if not any(map(str.isalpha, word)):  # A plain number
+        return word
+    return word.translate(LEETSPEAK_TABLE)
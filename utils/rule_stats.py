@@ -0,0 +1,58 @@
+from array import array
+
+
+class RuleStats:
+    """How often a rule ran and matched, and how long it took.
+
+    Durations go into a histogram of power of two nanosecond buckets, so
+    recording one is a few integer operations and percentiles are accurate to
+    within a factor of two.
+    """
+
+    __slots__ = ("evaluations", "hits", "total_ns", "histogram")
+
+    def __init__(self):
+        self.evaluations = 0
+        self.hits = 0
+        self.total_ns = 0
+        self.histogram = array("Q", bytes(8 * 64))  # Bucket i counts durations below 2 ** i ns
+
+    def record(self, elapsed_ns: int, hit: bool):
+        self.evaluations += 1
+        self.hits += hit
+        self.total_ns += elapsed_ns
+        self.histogram[min(elapsed_ns.bit_length(), 63)] += 1
+
+    def mean_ns(self) -> float:
+        return self.total_ns / self.evaluations if self.evaluations else 0
+
+    def percentile_ns(self, percent: float) -> int:
+        """Returns the upper bound of the bucket the ``percent``-th percentile falls in."""
+        rank = self.evaluations * percent / 100
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= rank:
+                return 2 ** bucket
+        return 0
+
+
+def format_ns(ns: float) -> str:
+    if ns < 1e3:
+        return f"{ns:.0f}ns"
+    if ns < 1e6:
+        return f"{ns / 1e3:.1f}us"
+    return f"{ns / 1e6:.1f}ms"
+
+
+def summary(stats: dict) -> str:
+    """Formats ``{rule name: RuleStats}`` as a table."""
+    lines = [f"{'rule':<20} {'runs':>8} {'hits':>7} {'hit%':>6} {'mean':>8} {'p50':>8} {'p99':>8}"]
+    for name, rule in stats.items():
+        lines.append(
+            f"{name:<20} {rule.evaluations:>8} {rule.hits:>7} "
+            f"{rule.hits / rule.evaluations * 100 if rule.evaluations else 0:>5.1f}% "
+            f"{format_ns(rule.mean_ns()):>8} {format_ns(rule.percentile_ns(50)):>8} "
+            f"{format_ns(rule.percentile_ns(99)):>8}"
+        )
+    return "\n".join(lines)
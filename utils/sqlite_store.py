@@ -0,0 +1,199 @@
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+from utils.journal import Journal, apply
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS levels (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    timestamp REAL NOT NULL DEFAULT 0,
+    xp INTEGER NOT NULL DEFAULT 0,
+    level INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS coin (
+    user_id INTEGER PRIMARY KEY,
+    amount INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS appeal_ban (
+    user_id INTEGER PRIMARY KEY,
+    cooldown REAL,
+    banned INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS data (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (name, key)
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+-- Nothing queries these, the leaderboard and appeals read the data in memory
+DROP INDEX IF EXISTS levels_guild_xp;
+DROP INDEX IF EXISTS appeal_ban_cooldown;
+"""
+
+
+class SQLiteStore:
+    """SQLite storage with the same interface as :class:`utils.journal.Journal`.
+
+    ``levels``, ``coin`` and ``appeal_ban`` get their own tables; any
+    other namespace is stored as JSON, one row per top-level key. The levels of
+    a single guild can be read and written as ``levels/<guild_id>``. Every batch
+    of records passed to :meth:`append` is written in a single transaction.
+    """
+
+    def __init__(self, directory: str = "data"):
+        self.directory = Path(directory)
+        self.directory.mkdir(exist_ok=True)
+        self.sizes = {}  # Always empty, the database never needs compacting
+        self.db = sqlite3.connect(str(self.directory / "bot.sqlite3"), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def migrate(self, names):
+        """Imports the ``data/<name>.json`` snapshots and logs once, renaming them to ``.migrated``."""
+        if self.db.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone():
+            return
+        journal = Journal(str(self.directory))
+        for name in names:
+            if any((self.directory / f"{name}.{suffix}").is_file() for suffix in ("json", "log")):
+                self.replace(name, journal.load(name))
+        for name in journal.partitions("levels"):  # Guilds split by the JSON backend
+            self.append(name, [[[k], v] for k, v in journal.load(name).items()])
+            journal.release(name)
+            for suffix in "json", "log":
+                path = self.directory / f"{name}.{suffix}"
+                if path.is_file():
+                    os.rename(path, self.directory / f"{name}.{suffix}.migrated")
+        journal.close()
+        for name in names:
+            for suffix in "json", "log":
+                path = self.directory / f"{name}.{suffix}"
+                if path.is_file():
+                    os.rename(path, self.directory / f"{name}.{suffix}.migrated")
+        with self.db:
+            self.db.execute("INSERT INTO meta VALUES ('migrated', '1')")
+
+    def load(self, name: str) -> dict:
+        data = {}
+        if name.startswith("levels/"):
+            for user_id, timestamp, xp, level in self.db.execute(
+                    "SELECT user_id, timestamp, xp, level FROM levels WHERE guild_id = ?", (int(name[7:]),)
+            ):
+                data[str(user_id)] = {"timestamp": timestamp, "xp": xp, "level": level}
+        elif name == "levels":
+            for guild_id, user_id, timestamp, xp, level in self.db.execute(
+                    "SELECT guild_id, user_id, timestamp, xp, level FROM levels"
+            ):
+                data.setdefault(str(guild_id), {})[str(user_id)] = {
+                    "timestamp": timestamp,
+                    "xp": xp,
+                    "level": level,
+                }
+        elif name == "coin":
+            for user_id, amount in self.db.execute("SELECT user_id, amount FROM coin"):
+                data[str(user_id)] = amount
+        elif name == "appeal_ban":
+            for user_id, cooldown, banned in self.db.execute(
+                    "SELECT user_id, cooldown, banned FROM appeal_ban"
+            ):
+                data[str(user_id)] = {"cooldown": cooldown, "banned": bool(banned)}
+        else:
+            for key, value in self.db.execute("SELECT key, value FROM data WHERE name = ?", (name,)):
+                data[key] = json.loads(value)
+        return data
+
+    def partitions(self, name: str) -> list:
+        """Returns the ``levels/<guild_id>`` namespace of every guild with level data."""
+        if name != "levels":
+            return []
+        return [f"levels/{guild_id}" for guild_id, in self.db.execute("SELECT DISTINCT guild_id FROM levels")]
+
+    def append(self, name: str, records: list):
+        """Applies a batch of ``[path]``/``[path, value]`` records in one transaction."""
+        prefix = []
+        if name.startswith("levels/"):
+            name, prefix = "levels", [name[7:]]
+        with self.db:
+            for path, *value in records:
+                self._write(name, prefix + path, value)
+
+    def _write(self, name: str, path, value: list):
+        if name == "levels" and len(path) == 2:
+            if value:
+                member = value[0]
+                self.db.execute(
+                    "INSERT OR REPLACE INTO levels VALUES (?, ?, ?, ?, ?)",
+                    (int(path[0]), int(path[1]), member["timestamp"], member["xp"], member["level"]),
+                )
+            else:
+                self.db.execute(
+                    "DELETE FROM levels WHERE guild_id = ? AND user_id = ?", (int(path[0]), int(path[1]))
+                )
+        elif name == "levels":
+            self.db.execute("DELETE FROM levels WHERE guild_id = ?", (int(path[0]),))
+            for user_id, member in (value[0] if value else {}).items():
+                self._write(name, [path[0], user_id], [member])
+        elif name == "coin":
+            if value:
+                self.db.execute("INSERT OR REPLACE INTO coin VALUES (?, ?)", (int(path[0]), value[0]))
+            else:
+                self.db.execute("DELETE FROM coin WHERE user_id = ?", (int(path[0]),))
+        elif name == "appeal_ban" and len(path) == 1:
+            if value:
+                appeal = value[0]
+                self.db.execute(
+                    "INSERT OR REPLACE INTO appeal_ban VALUES (?, ?, ?)",
+                    (int(path[0]), appeal["cooldown"], appeal["banned"]),
+                )
+            else:
+                self.db.execute("DELETE FROM appeal_ban WHERE user_id = ?", (int(path[0]),))
+        else:
+            key = path[0]
+            if len(path) > 1:  # Nested change, rewrite the whole top-level value
+                row = self.db.execute(
+                    "SELECT value FROM data WHERE name = ? AND key = ?", (name, key)
+                ).fetchone()
+                top = {key: json.loads(row[0])} if row else {}
+                apply(top, path, value)
+                value = [top[key]] if key in top else []
+            if value:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO data VALUES (?, ?, ?)",
+                    (name, key, json.dumps(value[0], ensure_ascii=False)),
+                )
+            else:
+                self.db.execute("DELETE FROM data WHERE name = ? AND key = ?", (name, key))
+
+    def compact(self, name: str):
+        """Checkpoints the WAL; the tables are already up to date after :meth:`append`."""
+        self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def replace(self, name: str, data: dict):
+        """Replaces a whole namespace with ``data``."""
+        table = name if name in ("levels", "coin", "appeal_ban") else None
+        with self.db:
+            if table:
+                self.db.execute(f"DELETE FROM {table}")
+            else:
+                self.db.execute("DELETE FROM data WHERE name = ?", (name,))
+            for key, value in data.items():
+                self._write(name, [key], [value])
+
+    def release(self, name: str):
+        pass
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import re
+
+TOKEN_REGEX = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list:
+    return TOKEN_REGEX.findall(text.lower())
+
+
+class TermIndex:
+    """Finds whole-word terms in a text, like a ``\\b(term|...)\\b`` regex.
+
+    Single word terms are kept in a set. Terms of several words, like
+    "new york", are indexed by their first word, so a text is checked with a
+    set lookup per word and a comparison for each phrase starting with it.
+    Punctuation inside a term counts as a word break, "port-au-prince" is
+    matched as "port au prince".
+    """
+
+    def __init__(self, words=(), phrases=None):
+        self.words = set(words)
+        self.phrases = phrases or {}  # First word -> tuples of the words after it
+
+    @classmethod
+    def build(cls, terms) -> "TermIndex":
+        index = cls()
+        for term in terms:
+            tokens = tokenize(term)
+            if len(tokens) == 1:
+                index.words.add(tokens[0])
+            elif tokens:
+                rest = tuple(tokens[1:])
+                if rest not in index.phrases.setdefault(tokens[0], []):
+                    index.phrases[tokens[0]].append(rest)
+        return index
+
+    def __len__(self):
+        return len(self.words) + sum(map(len, self.phrases.values()))
+
+    def search(self, text: str):
+        """Returns the first term found in ``text``, or ``None``."""
+        tokens = tokenize(text)
+        words, phrases = self.words, self.phrases
+        for i, token in enumerate(tokens):
+            if token in words:
+                return token
+            for rest in phrases.get(token, ()):
+                if tuple(tokens[i + 1: i + 1 + len(rest)]) == rest:
+                    return " ".join((token,) + rest)
+        return None
+
+    @classmethod
+    def cached(cls, cache_path: str, sources, build, extra=()) -> "TermIndex":
+        """Loads the index from ``cache_path``, or calls ``build()`` and saves it there.
+
+        The cache is keyed by a hash of the ``sources`` files and the ``extra``
+        terms, so it's rebuilt whenever one of them changes.
+        """
+        digest = hashlib.sha256("\n".join(extra).encode())
+        for path in sources:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        key = digest.hexdigest()
+
+        try:
+            with open(cache_path) as f:
+                cache = json.load(f)
+            if cache["key"] == key:
+                return cls(cache["words"], {first: list(map(tuple, rest)) for first, rest in cache["phrases"].items()})
+        except (OSError, ValueError, KeyError):
+            pass
+
+        index = build()
+        tmp = f"{cache_path}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"key": key, "words": sorted(index.words), "phrases": index.phrases}, f)
+            os.replace(tmp, cache_path)
+        except OSError:  # Still usable, it's just built again next time
+            pass
+        return index
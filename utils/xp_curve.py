@@ -0,0 +1,67 @@
+from bisect import bisect_right
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+XP_LIMIT = 2 ** 63 - 1  # XP is stored as a signed 64-bit int
+
+
+class XPCurve:
+    """Total XP needed to get past each level, ``int(base * factor ** level + offset)``.
+
+    The thresholds are computed once, so looking up the level of an XP amount is
+    a bisection instead of a power per message.
+    """
+
+    def __init__(self, base: float = 200, factor: float = 1.32, offset: float = -100, max_level: int = 10000):
+        self.thresholds = []
+        for level in range(max_level):
+            try:
+                xp = int(base * factor ** level + offset)
+            except OverflowError:
+                break
+            if xp > XP_LIMIT:
+                break
+            if self.thresholds and xp < self.thresholds[-1]:
+                raise ValueError("The XP curve must not decrease")
+            self.thresholds.append(xp)
+        if numpy is not None:
+            self._thresholds = numpy.array(self.thresholds, dtype=numpy.int64)
+
+    def required_xp(self, level: int) -> int:
+        """Returns the total XP needed to get past ``level``."""
+        if level < len(self.thresholds):
+            return self.thresholds[level]
+        return XP_LIMIT
+
+    def level(self, xp: int) -> int:
+        return bisect_right(self.thresholds, xp)
+
+
+def relevel(guild, curve: XPCurve) -> list:
+    """Sets the level of every member of a GuildLevels to match ``curve``.
+
+    Uses one NumPy pass over the typed arrays when NumPy is installed.
+    Returns the ids of the members whose level changed.
+    """
+    if not len(guild):
+        return []
+    if numpy is None:
+        changed = []
+        for row, xp in enumerate(guild.xp):
+            level = curve.level(xp)
+            if level != guild.level[row]:
+                guild.level[row] = level
+                changed.append(guild.ids[row])
+        return changed
+
+    xp = numpy.frombuffer(guild.xp, dtype=numpy.int64)
+    levels = numpy.frombuffer(guild.level, dtype=numpy.int32)  # Writes go straight to the array
+    new = numpy.searchsorted(curve._thresholds, xp, side="right").astype(numpy.int32)
+    rows = numpy.flatnonzero(new != levels)
+    levels[rows] = new[rows]
+    changed = numpy.frombuffer(guild.ids, dtype=numpy.uint64)[rows].tolist()
+    del xp, levels  # Exported buffers would stop the arrays from growing
+    return changed